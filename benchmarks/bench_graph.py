@@ -0,0 +1,123 @@
+#bench_graph
+#Compares the rankings of the sparsified and approximate similarity graphs with the exact graph: for every
+#text, each graph mode reports its build and rank time, its number of edges, the Spearman correlation of its
+#scores with the exact ones and the share of the exact top ratio sentences it selects as well. Texts are the
+#bundled article, files given with --files and synthetic texts of --sentences sentences. The exact and top k
+#graphs score every pair, they are skipped above --max-exact sentences and approximate is then only timed.
+#Run from the repository root:
+#    python benchmarks/bench_graph.py --sentences 2000 20000 50000 --top-k 20
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+ARTICLE = os.path.join(ROOT, 'jr_abst', 'summarization', 'News Articles', 'tech', 'input.txt')
+LETTERS = 'bcdfghjklmnprstvz'
+VOWELS = 'aeiou'
+
+
+def _word(i):
+    # pronounceable, digit free, so that the preprocessing keeps it
+    syllables = []
+    while True:
+        i, consonant = divmod(i, len(LETTERS))
+        i, vowel = divmod(i, len(VOWELS))
+        syllables.append(LETTERS[consonant] + VOWELS[vowel])
+        if i == 0:
+            return ''.join(syllables) + 'n'
+        i -= 1
+
+
+def synthetic_text(n_sentences, seed=0, vocabulary=20000, topics=200):
+    #Sentences mix the words of one topic with Zipf distributed background words.
+    rnd = random.Random(seed)
+    topic_words = [[rnd.randrange(vocabulary) for _ in range(30)] for _ in range(topics)]
+    # cumulated once, choices would add the weights up again for every sentence
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocabulary)))
+    word_ids = range(vocabulary)
+    sentences = []
+    for _ in range(n_sentences):
+        topic = topic_words[rnd.randrange(topics)]
+        length = rnd.randint(6, 16)
+        n_topic = rnd.randint(1, length // 2)
+        words = [rnd.choice(topic) for _ in range(n_topic)]
+        words += rnd.choices(word_ids, cum_weights=cum_weights, k=length - n_topic)
+        rnd.shuffle(words)
+        text = ' '.join(_word(word) for word in words)
+        sentences.append(text[0].upper() + text[1:] + '.')
+    return ' '.join(sentences)
+
+
+def build_corpus(text):
+    from jr_abst.summarization.textcleaner import build_sentence_store
+    store = build_sentence_store(text)
+    return [store.bow(i) for i in range(len(store))]
+
+
+def _rank(corpus, **options):
+    from jr_abst.summarization.summarizer import rank_sentences
+    start = time.perf_counter()
+    indices, scores = rank_sentences(corpus, **options)
+    return indices, scores, time.perf_counter() - start
+
+
+def _edges(corpus, **options):
+    from jr_abst.summarization.summarizer import _build_array_graph
+    return int(_build_array_graph(corpus, **options).adjacency.nnz // 2)
+
+
+def compare(name, corpus, modes, ratio, max_exact):
+    import numpy
+    from scipy.stats import spearmanr
+    result = {'text': name, 'sentences': len(corpus), 'modes': {}}
+    selected = max(1, int(len(corpus) * ratio))
+    exact = None
+    if len(corpus) > max_exact:
+        modes = [(mode, options) for mode, options in modes if options.get('approximate')]
+    for mode, options in modes:
+        indices, scores, seconds = _rank(corpus, **options)
+        graph_options = dict((key, value) for key, value in options.items() if key != 'sparse')
+        stats = {'seconds': seconds, 'edges': _edges(corpus, **graph_options)}
+        by_index = numpy.zeros(len(corpus))
+        by_index[indices] = scores
+        if mode == 'exact':
+            exact = (set(indices[:selected].tolist()), by_index)
+        elif exact is not None:
+            stats['spearman'] = float(spearmanr(exact[1], by_index)[0])
+            stats['top_overlap'] = len(exact[0] & set(indices[:selected].tolist())) / float(selected)
+        result['modes'][mode] = stats
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quality and cost of approximate similarity graphs")
+    parser.add_argument('--files', nargs='*', default=[], help="text files to summarize")
+    parser.add_argument('--sentences', type=int, nargs='*', default=[2000, 10000],
+                        help="sizes of the synthetic texts")
+    parser.add_argument('--top-k', type=int, default=20, help="neighbours kept per sentence")
+    parser.add_argument('--ratio', type=float, default=0.2, help="share of sentences compared as selected")
+    parser.add_argument('--max-exact', type=int, default=10000, help="largest text ranked with the exact graphs")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    texts = [(os.path.basename(ARTICLE), open(ARTICLE).read())]
+    texts += [(path, open(path).read()) for path in args.files]
+    texts += [('synthetic-%d' % n, synthetic_text(n, args.seed)) for n in args.sentences]
+    modes = [
+        ('exact', {'sparse': True}),
+        ('top_k', {'top_k': args.top_k}),
+        ('approximate', {'top_k': args.top_k, 'approximate': True}),
+    ]
+    results = [compare(name, build_corpus(text), modes, args.ratio, args.max_exact) for name, text in texts]
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#bench_import
+#Measures the cold start cost of jr_abst.summarization: every statement runs in a fresh interpreter,
+#the wall time of the interpreter and the heavy modules that got loaded are reported as JSON. A statement
+#that fails is reported with the error of its interpreter, and the exit status is then 1.
+#Run from the repository root:
+#    python benchmarks/bench_import.py --repeat 10 --max-seconds 0.5
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['numpy', 'scipy', 'scipy.sparse', 'scipy.linalg', 'scipy.sparse.linalg', 'gensim',
+                 'multiprocessing', 'pattern']
+STATEMENTS = {
+    'package': 'import jr_abst.summarization',
+    'summarize': 'from jr_abst.summarization import summarize',
+}
+
+#runs in the child: times the statement and lists the heavy modules it imported
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+exec(%r)
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure(statement, repeat):
+    runs = []
+    for _ in range(repeat):
+        child = subprocess.Popen([sys.executable, '-c', CHILD % (statement, HEAVY_MODULES)], cwd=ROOT,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, error = child.communicate()
+        if child.returncode != 0:
+            # the last line of the traceback names the error
+            lines = error.decode('utf8', 'replace').strip().splitlines()
+            return {'statement': statement, 'error': lines[-1] if lines else 'exit status %d' % child.returncode}
+        runs.append(json.loads(output.decode('utf8').strip().splitlines()[-1]))
+    seconds = sorted(run['seconds'] for run in runs)
+    return {
+        'statement': statement,
+        'median_seconds': seconds[len(seconds) // 2],
+        'min_seconds': seconds[0],
+        'max_seconds': seconds[-1],
+        'loaded': runs[-1]['loaded'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__ or "Import time benchmark of jr_abst.summarization")
+    parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per statement")
+    parser.add_argument('--only', choices=sorted(STATEMENTS), action='append', help="statements to measure")
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help="exit with status 1 when the median import of the package is slower")
+    args = parser.parse_args(argv)
+
+    results = dict((name, measure(STATEMENTS[name], args.repeat)) for name in (args.only or sorted(STATEMENTS)))
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    if any('error' in result for result in results.values()):
+        return 1
+    if args.max_seconds is not None and 'package' in results \
+            and results['package']['median_seconds'] > args.max_seconds:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+#bench_summarize
+#Benchmark suite of summarize: every text is summarized --repeat times in every graph mode, after a first call
+#that is not timed. The suite reports the latency percentiles and throughput of the whole call, the median
+#wall and CPU time of every stage (as reported by the metrics callback), the memory every stage allocated at
+#its peak, measured in one more run traced by tracemalloc, and the peak memory of the process. Each case runs
+#in a fresh interpreter so that the peak memory of the process is its own. The BM25 weights of the synthetic
+#texts, the stage that the scoring pool spreads over processes, and summarize_many on many short texts are
+#then timed serially and with --n-jobs processes. Texts are the bundled article, files given with --files and
+#synthetic texts of --sentences sentences, all generated offline and reproducible with --seed. Modes that
+#score every pair of sentences are skipped above --max-default and --max-exact sentences.
+#With --baseline, the results are compared with a saved run and the exit status is 1 when a case got slower
+#than --tolerance allows. benchmarks/baseline.json is a run of the default suite with --n-jobs 1 on one CPU,
+#timings only compare on the same machine, so save a baseline of your own before a change. Cases of a few
+#milliseconds vary by more than the tolerance from one run to the next, keep --repeat at 5 or more for them.
+#Run from the repository root:
+#    python benchmarks/bench_summarize.py --output current.json
+#    python benchmarks/bench_summarize.py --sentences 10 1000 100000 --baseline current.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+ARTICLE = os.path.join(ROOT, 'jr_abst', 'summarization', 'News Articles', 'tech', 'input.txt')
+SENTENCES = [10, 100, 1000, 10000, 100000]
+#options of summarize of every mode
+MODES = [
+    ('default', {}),
+    ('sparse', {'sparse': True}),
+    ('top_k', {'top_k': 20}),
+    ('approximate', {'approximate': True}),
+]
+PERCENTILES = [50, 90, 99]
+
+
+def _percentile(values, percentile):
+    # nearest rank
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(round(percentile / 100.0 * len(values))) - 1))]
+
+
+def _median(values):
+    return _percentile(values, 50)
+
+
+def _load_text(source, seed):
+    if source.startswith('synthetic-'):
+        from bench_graph import synthetic_text
+        return synthetic_text(int(source[len('synthetic-'):]), seed)
+    with open(ARTICLE if source == 'article' else source) as text_file:
+        return text_file.read()
+
+
+def run_case(case):
+    #Summarizes the text of case repeat times in its mode, in this process, and returns its results.
+    from jr_abst.summarization.summarizer import summarize
+    from jr_abst.summarization.metrics import MetricsRecorder, peak_memory
+    text = _load_text(case['text'], case['seed'])
+    memory_before = peak_memory()
+    # the first call imports gensim and fills the caches, it is not timed
+    summarize(text, ratio=case['ratio'], **case['options'])
+    latencies = []
+    stages = {}
+    sentences = 0
+    for _ in range(case['repeat']):
+        recorder = MetricsRecorder()
+        start = time.perf_counter()
+        summarize(text, ratio=case['ratio'], metrics=recorder, **case['options'])
+        latencies.append(time.perf_counter() - start)
+        for record in recorder.records:
+            stage = stages.setdefault(record.stage, {'wall': [], 'cpu': [], 'nodes': record.nodes,
+                                                     'edges': record.edges})
+            stage['wall'].append(record.wall_time)
+            stage['cpu'].append(record.cpu_time)
+            if record.stage == 'cleaning':
+                sentences = record.nodes
+    # before the traced run, the traces take memory too
+    process_peak = peak_memory()
+    # tracing slows the stages down, memory is measured in a run that is not timed
+    recorder = MetricsRecorder()
+    tracemalloc.start()
+    try:
+        summarize(text, ratio=case['ratio'], metrics=recorder, **case['options'])
+    finally:
+        tracemalloc.stop()
+    for record in recorder.records:
+        if record.stage in stages:
+            stages[record.stage]['peak_allocated'] = record.peak_allocated
+    result = {
+        'sentences': sentences,
+        'latency': dict(('p%d' % p, _percentile(latencies, p)) for p in PERCENTILES),
+        'sentences_per_second': sentences / _median(latencies) if _median(latencies) > 0 else None,
+        'peak_memory': process_peak,
+        'memory_before': memory_before,
+        'stages': dict((name, {'wall_time': _median(stage['wall']), 'cpu_time': _median(stage['cpu']),
+                               'peak_allocated': stage.get('peak_allocated'), 'nodes': stage['nodes'],
+                               'edges': stage['edges']})
+                       for name, stage in stages.items()),
+    }
+    return result
+
+
+def run_isolated(case):
+    # a fresh interpreter per case, its peak memory is not the one of the cases before
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+                                     cwd=ROOT)
+    return json.loads(output.decode('utf8').strip().splitlines()[-1])
+
+
+def run_many(n_texts, n_sentences, n_jobs, chunksize, seed, repeat):
+    #Times summarize_many on n_texts synthetic texts of n_sentences sentences.
+    from bench_graph import synthetic_text
+    from jr_abst.summarization.summarizer import summarize_many
+    texts = [synthetic_text(n_sentences, seed + i) for i in range(n_texts)]
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in summarize_many(texts, n_jobs=n_jobs, chunksize=chunksize):
+            pass
+        seconds.append(time.perf_counter() - start)
+    return {
+        'texts': n_texts,
+        'sentences': n_sentences,
+        'n_jobs': n_jobs,
+        'chunksize': chunksize,
+        'seconds': _median(seconds),
+        'texts_per_second': n_texts / _median(seconds),
+    }
+
+
+def run_weights(n_sentences, n_jobs, seed, repeat):
+    #Times the BM25 weights of a synthetic text of n_sentences sentences, as iter_bm25_bow yields them, in
+    #n_jobs processes. The scoring pool is started before the timed runs.
+    from bench_graph import build_corpus, synthetic_text
+    from jr_abst.summarization.bm25 import close_scoring_pool, get_scoring_pool, iter_bm25_bow
+    from jr_abst.summarization.utils import effective_n_jobs
+    corpus = build_corpus(synthetic_text(n_sentences, seed))
+    seconds = []
+    try:
+        if effective_n_jobs(n_jobs) > 1:
+            get_scoring_pool(effective_n_jobs(n_jobs))
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in iter_bm25_bow(corpus, n_jobs=n_jobs, sparse=True):
+                pass
+            seconds.append(time.perf_counter() - start)
+    finally:
+        close_scoring_pool()
+    return {
+        'sentences': len(corpus),
+        'n_jobs': n_jobs,
+        'seconds': _median(seconds),
+        'sentences_per_second': len(corpus) / _median(seconds),
+    }
+
+
+def _cases(args):
+    texts = ['article'] + list(args.files) + ['synthetic-%d' % n for n in args.sentences]
+    for text in texts:
+        size = int(text[len('synthetic-'):]) if text.startswith('synthetic-') else None
+        for mode, options in MODES:
+            if args.modes and mode not in args.modes:
+                continue
+            if size is not None and (mode == 'default' and size > args.max_default
+                                     or mode in ('sparse', 'top_k') and size > args.max_exact):
+                continue
+            yield {'id': '%s/%s' % (os.path.basename(text), mode), 'text': text, 'mode': mode,
+                   'options': options, 'ratio': args.ratio, 'seed': args.seed,
+                   'repeat': max(1, args.repeat if size is None or size <= 10000 else 1)}
+
+
+def compare(results, baseline, tolerance):
+    #Returns the relative change of the median latency of every case, weights and summarize_many run found
+    #in baseline, and the ids of the ones slower than 1 + tolerance times their baseline.
+    changes = {}
+    regressions = []
+    pairs = [(case_id, result['latency']['p50'], baseline['cases'][case_id]['latency']['p50'])
+             for case_id, result in results['cases'].items() if case_id in baseline.get('cases', {})]
+    for section in ('weights', 'many'):
+        # the runs of a section are told from the cases by its name
+        pairs += [('%s %s' % (section, run_id), result['seconds'], baseline[section][run_id]['seconds'])
+                  for run_id, result in results[section].items() if run_id in baseline.get(section, {})]
+    for case_id, current, previous in sorted(pairs):
+        changes[case_id] = current / previous - 1 if previous > 0 else None
+        if previous > 0 and current > previous * (1 + tolerance):
+            regressions.append(case_id)
+    return {'tolerance': tolerance, 'changes': changes, 'regressions': regressions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stage and end to end benchmark of summarize")
+    parser.add_argument('--files', nargs='*', default=[], help="text files to summarize")
+    parser.add_argument('--sentences', type=int, nargs='*', default=SENTENCES, help="sizes of the synthetic texts")
+    parser.add_argument('--modes', nargs='*', choices=[mode for mode, _ in MODES], help="graph modes to run")
+    parser.add_argument('--ratio', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=5, help="runs per case, 1 above 10000 sentences")
+    parser.add_argument('--max-default', type=int, default=2000,
+                        help="largest text summarized with the default graph")
+    parser.add_argument('--max-exact', type=int, default=10000,
+                        help="largest text summarized with the sparse and top k graphs")
+    parser.add_argument('--many-texts', type=int, default=200, help="texts of the summarize_many runs, 0 skips them")
+    parser.add_argument('--many-sentences', type=int, default=30, help="sentences of every summarize_many text")
+    parser.add_argument('--n-jobs', type=int, nargs='*', default=[1, 4],
+                        help="processes of the weights and summarize_many runs")
+    parser.add_argument('--chunksize', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--in-process', action='store_true',
+                        help="run the cases in this interpreter, peak memory is then cumulative")
+    parser.add_argument('--output', help="file the results are written to, default standard output")
+    parser.add_argument('--baseline', help="results of a previous run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="slowdown of the median latency above which a case is a regression")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': {},
+        'weights': {},
+        'many': {},
+    }
+    for case in _cases(args):
+        result = run_case(case) if args.in_process else run_isolated(case)
+        result['mode'] = case['mode']
+        results['cases'][case['id']] = result
+        sys.stderr.write('%s: %.3fs\n' % (case['id'], result['latency']['p50']))
+    for n_sentences in args.sentences:
+        if n_sentences > args.max_exact:
+            continue
+        for n_jobs in args.n_jobs:
+            weights = run_weights(n_sentences, n_jobs, args.seed, max(1, args.repeat))
+            weights_id = 'synthetic-%d/n_jobs=%d' % (n_sentences, n_jobs)
+            results['weights'][weights_id] = weights
+            sys.stderr.write('weights %s: %.3fs\n' % (weights_id, weights['seconds']))
+    if args.many_texts > 0:
+        for n_jobs in args.n_jobs:
+            many = run_many(args.many_texts, args.many_sentences, n_jobs, args.chunksize, args.seed, args.repeat)
+            many_id = '%dx%d/n_jobs=%d' % (args.many_texts, args.many_sentences, n_jobs)
+            results['many'][many_id] = many
+            sys.stderr.write('summarize_many %s: %.3fs\n' % (many_id, many['seconds']))
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            results['comparison'] = compare(results, json.load(baseline_file), args.tolerance)
+        if results['comparison']['regressions']:
+            status = 1
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+            output.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,30 @@
-# bring model classes directly into package namespace, to save some typing
-from .summarizer import summarize, summarize_corpus  # noqa:F401
-#from .keywords import keywords  # noqa:F401
-#from .mz_entropy import mz_keywords  # noqa:F401
+# bring model classes directly into package namespace, to save some typing
+# they are imported on first access, importing the package does not load numpy, scipy or gensim
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'summarize': 'summarizer',
+    'summarize_corpus': 'summarizer',
+    'summarize_many': 'summarizer',
+    'summarize_stream': 'streaming',
+    'SummaryCache': 'cache',
+    'LiveSummarizer': 'streaming',
+    'MetricsRecorder': 'metrics',
+    'SummarizationService': 'service',
+}
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('.' + _LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+#from .keywords import keywords  # noqa:F401
+#from .mz_entropy import mz_keywords  # noqa:F401
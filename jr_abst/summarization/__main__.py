@@ -0,0 +1,184 @@
+#__main__
+#Batch summarizer: reads records from files or standard input, summarizes them with summarize_many and writes
+#one JSON line {"id", "summary"} or {"id", "error"} per record, in input order. Records are JSON lines with a
+#text field, or lines of plain text with --text. Texts are read as the workers need them, so memory does not
+#depend on the size of the input. With --resume, the records already in --output are skipped and the new
+#ones appended, so an interrupted run can be started again with the same command:
+#    python -m jr_abst.summarization articles.jsonl --n-jobs 8 --output summaries.jsonl --resume
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from jr_abst.summarization.summarizer import summarize_many
+
+logger = logging.getLogger(__name__)
+
+#seconds between two throughput reports
+STATS_INTERVAL = 10.0
+
+
+def _iter_records(paths, text_format, text_field, id_field):
+    # (id, text or the error that made the record unreadable), the id of a record without one is path:line
+    for path in paths:
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf8')
+            try:
+                for record in _parse_records('<stdin>', stream, text_format, text_field, id_field):
+                    yield record
+            finally:
+                # standard input stays open
+                stream.detach()
+        else:
+            with io.open(path, encoding='utf8') as stream:
+                for record in _parse_records(path, stream, text_format, text_field, id_field):
+                    yield record
+
+
+def _parse_records(name, stream, text_format, text_field, id_field):
+    for number, line in enumerate(stream, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+        record_id = '%s:%d' % (name, number)
+        if text_format:
+            yield record_id, line
+            continue
+        try:
+            record = json.loads(line)
+            text = record[text_field]
+            record_id = record.get(id_field, record_id)
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            text = ValueError("Unreadable record: %r" % error)
+        yield record_id, text
+
+
+def _completed_ids(path):
+    #Returns the ids found in the output of a previous run. A last line cut by a crash is truncated.
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with io.open(path, 'rb+') as output:
+        end = 0
+        for line in output:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                done.add(_id_key(json.loads(line.decode('utf8'))['id']))
+            except (ValueError, KeyError, TypeError):
+                break
+            end += len(line)
+        output.truncate(end)
+    return done
+
+
+def _id_key(record_id):
+    # ids are compared as JSON, 1 and "1" stay distinct
+    return json.dumps(record_id, sort_keys=True)
+
+
+class _Throughput(object):
+    def __init__(self, interval):
+        self.interval = interval
+        self.started = self.reported = time.perf_counter()
+        self.records = 0
+        self.errors = 0
+        self.skipped = 0
+
+    def add(self, error):
+        self.records += 1
+        self.errors += error
+        now = time.perf_counter()
+        if self.interval and now - self.reported >= self.interval:
+            self.reported = now
+            self.report()
+
+    def report(self):
+        seconds = time.perf_counter() - self.started
+        sys.stderr.write('%d records, %d errors, %d skipped, %.1fs, %.1f records/s\n' % (
+            self.records, self.errors, self.skipped, seconds, self.records / seconds if seconds > 0 else 0.0))
+        sys.stderr.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m jr_abst.summarization',
+                                     description="Summarizes every record of the input files as JSON lines")
+    parser.add_argument('inputs', nargs='*', default=['-'], help="input files, - for standard input (default)")
+    parser.add_argument('--output', '-o', help="output file, default standard output")
+    parser.add_argument('--resume', action='store_true', help="skip the records already in --output")
+    parser.add_argument('--text', action='store_true', help="every line is the text of a record")
+    parser.add_argument('--text-field', default='text', help="field of the text in JSON records")
+    parser.add_argument('--id-field', default='id', help="field of the id in JSON records")
+    parser.add_argument('--ratio', type=float, default=0.2)
+    parser.add_argument('--word-count', type=int, default=None)
+    parser.add_argument('--split', action='store_true', help="summaries as lists of sentences")
+    parser.add_argument('--sparse', action='store_true')
+    parser.add_argument('--top-k', type=int, default=None)
+    parser.add_argument('--approximate', action='store_true')
+    parser.add_argument('--hash-bits', type=int, default=None, help="hash tokens to ids of this many bits")
+    parser.add_argument('--batch', action='store_true', help="rank the texts of a chunk together")
+    parser.add_argument('--n-jobs', type=int, default=1, help="worker processes, -1 for all CPUs")
+    parser.add_argument('--chunksize', type=int, default=1, help="records sent to a worker at once")
+    parser.add_argument('--max-pending', type=int, default=None, help="chunks in flight, default two per worker")
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL,
+                        help="seconds between throughput reports on standard error, 0 for none")
+    args = parser.parse_args(argv)
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+
+    done = _completed_ids(args.output) if args.resume else set()
+    throughput = _Throughput(args.stats_interval)
+    ids = deque()
+
+    def texts():
+        for record_id, text in _iter_records(args.inputs, args.text, args.text_field, args.id_field):
+            if _id_key(record_id) in done:
+                throughput.skipped += 1
+                continue
+            if isinstance(text, Exception):
+                # unreadable records go through as empty texts, their error replaces the summary
+                ids.append((record_id, text))
+                yield u""
+            else:
+                ids.append(record_id)
+                yield text
+
+    if args.output:
+        output = io.open(args.output, 'a' if args.resume else 'w', encoding='utf8')
+    else:
+        output = io.TextIOWrapper(sys.stdout.buffer, encoding='utf8', line_buffering=True)
+    summaries = summarize_many(texts(), ratio=args.ratio, word_count=args.word_count, split=args.split,
+                               sparse=args.sparse, n_jobs=args.n_jobs, chunksize=args.chunksize,
+                               max_pending=args.max_pending, top_k=args.top_k, approximate=args.approximate,
+                               batch=args.batch, hash_bits=args.hash_bits)
+    try:
+        for summary in summaries:
+            record_id = ids.popleft()
+            if isinstance(record_id, tuple):
+                record_id, summary = record_id
+            if isinstance(summary, Exception):
+                result = {'id': record_id, 'error': str(summary) or type(summary).__name__}
+            else:
+                result = {'id': record_id, 'summary': summary}
+            output.write(json.dumps(result, ensure_ascii=False) + u'\n')
+            # every record is on disk once written, a crash loses at most the records in flight
+            output.flush()
+            throughput.add('error' in result)
+    finally:
+        summaries.close()
+        if args.output:
+            output.close()
+        else:
+            output.flush()
+            output.detach()
+        if args.stats_interval:
+            throughput.report()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
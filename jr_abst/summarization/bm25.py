@@ -1,26 +1,57 @@
 #bm25
+import atexit
+import hashlib
+import heapq
+import json
 import math
-from six import iteritems
+import os
+import tempfile
+import threading
+import uuid
+from collections.abc import Mapping
+from contextlib import contextmanager
+import numpy
+from scipy.sparse import csr_matrix
+from six import iteritems, string_types
 from six.moves import range
-from functools import partial
-from multiprocessing import Pool
-from jr_abst.utils import effective_n_jobs
+from bisect import bisect_left
+from jr_abst.summarization.hashing import hash_tokens, HASH_BITS
+from jr_abst.summarization.utils import effective_n_jobs
 
 PARAM_K1 = 1.5
 PARAM_B = 0.75
 EPSILON = 0.25
+#number of query rows scored per sparse matrix product when iterating all pairs
+SPARSE_BLOCK_SIZE = 1024
+#parallel scoring: smaller corpora are scored in the calling process, larger ones are split in
+#this many sentence ranges per worker of the shared pool
+PARALLEL_MIN_DOCUMENTS = 1000
+PARALLEL_CHUNKS_PER_PROCESS = 4
+#saved models: a directory with one .npy file per array, loaded memory mapped, and a meta.json written last
+MODEL_FORMAT_VERSION = 1
+MODEL_META = 'meta.json'
+MODEL_ARRAYS = ('idf', 'doc_len', 'vocabulary', 'vocabulary_offsets', 'tf_data', 'tf_indices', 'tf_indptr',
+                'weights_t_data', 'weights_t_indices', 'weights_t_indptr')
+#documents hashed together when a background table is built
+BACKGROUND_BLOCK_SIZE = 10000
 
 class BM25(object):
-    def __init__(self, corpus):
+    #With a BackgroundIDF, the idf of a word is background_weight times its background idf plus 1 -
+    #background_weight times its idf in corpus. With the default weight of 1 the document frequencies of
+    #corpus are not counted at all.
+    def __init__(self, corpus, background_idf=None, background_weight=1.0):
         self.corpus_size = 0
         self.avgdl = 0
         self.doc_freqs = []
         self.idf = {}
         self.doc_len = []
+        self.background_idf = background_idf
+        self.background_weight = background_weight
         self._initialize(corpus)
 
     def _initialize(self, corpus):
         nd = {}  # word -> number of documents with word
+        count = self.background_idf is None or self.background_weight < 1
         num_doc = 0
         for document in corpus:
             self.corpus_size += 1
@@ -33,12 +64,61 @@ class BM25(object):
                 frequencies[word] += 1
             self.doc_freqs.append(frequencies)
 
+            if not count:
+                # only the words are needed, their background idf does not depend on corpus
+                nd.update(frequencies)
+                continue
             for word, freq in iteritems(frequencies):
                 if word not in nd:
                     nd[word] = 0
                 nd[word] += 1
 
         self.avgdl = float(num_doc) / self.corpus_size
+        if count:
+            self._set_idf(nd)
+        else:
+            self.idf = dict(zip(nd, self.background_idf.lookup(nd).tolist()))
+            self.average_idf = float(sum(self.idf.values())) / len(self.idf)
+
+    def save(self, path):
+        #Saves the model in directory path, MappedBM25.load opens it. Words have to be strings.
+        words = list(self.idf)
+        if not all(isinstance(word, string_types) for word in words):
+            raise TypeError("Only models of string words can be saved")
+        # sorted, so that a loaded model finds words by bisection without building a dict
+        words.sort()
+        vocabulary = dict((word, i) for i, word in enumerate(words))
+        encoded = [word.encode('utf8') for word in words]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(word) for word in encoded], out=offsets[1:])
+
+        tf = _term_frequency_matrix(self.doc_freqs, vocabulary)
+        idf = numpy.array([self.idf[word] for word in words], dtype=numpy.float64)
+        doc_len = numpy.asarray(self.doc_len, dtype=numpy.float64)
+        weights_t = _bm25_weight_matrix(tf, idf, doc_len, self.avgdl).T.tocsr()
+        arrays = {
+            'idf': idf,
+            'doc_len': doc_len,
+            'vocabulary': numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8),
+            'vocabulary_offsets': offsets,
+        }
+        arrays.update(_csr_arrays('tf', tf))
+        arrays.update(_csr_arrays('weights_t', weights_t))
+        _save_model(path, arrays, self.corpus_size, self.avgdl, self.average_idf)
+
+    def _set_idf(self, nd):
+        self._set_local_idf(nd)
+        if self.background_idf is not None and self.idf:
+            # blended with the background, the local idfs already have their EPSILON floor
+            words = list(self.idf)
+            background = self.background_idf.lookup(words)
+            local = numpy.fromiter((self.idf[word] for word in words), dtype=numpy.float64, count=len(words))
+            blended = self.background_weight * background + (1 - self.background_weight) * local
+            self.idf = dict(zip(words, blended.tolist()))
+            self.average_idf = float(blended.mean())
+
+    def _set_local_idf(self, nd):
+        self.idf = {}
         #collecting the idf sum to calculate an average idf for some epsilon value
         idf_sum = 0
         #collect words with negative idf to set them a special epsilon value and sometimes
@@ -78,42 +158,760 @@ class BM25(object):
                 scores.append((index, score))
         return scores
 
-    
-def _get_scores_bow(bm25, document):
-    return bm25.get_scores_bow(document)
+
+class IncrementalBM25(BM25):
+    #BM25 over a corpus that changes. Added and removed documents update the document frequencies,
+    #lengths and average length in place, the idf (and its EPSILON floor) is then recomputed from the
+    #document frequencies alone, once, the next time a score is asked for. Scores are the ones of a BM25
+    #built from scratch on the current documents, in the same order.
+    def __init__(self, corpus=(), background_idf=None, background_weight=1.0):
+        self.doc_count = {}  # word -> number of documents with word
+        self.total_len = 0
+        self._stale = False
+        super(IncrementalBM25, self).__init__(corpus, background_idf, background_weight)
+
+    def _initialize(self, corpus):
+        for document in corpus:
+            self._add(document)
+        self.update()
+
+    def _add(self, document):
+        frequencies = {}
+        for word in document:
+            if word not in frequencies:
+                frequencies[word] = 0
+            frequencies[word] += 1
+        self.doc_freqs.append(frequencies)
+        self.doc_len.append(len(document))
+        self.total_len += len(document)
+        self.corpus_size += 1
+        for word in frequencies:
+            self.doc_count[word] = self.doc_count.get(word, 0) + 1
+        self._stale = True
+
+    def add_document(self, document):
+        #Adds document at the end of the corpus and returns its index.
+        self._add(document)
+        return self.corpus_size - 1
+
+    def add_documents(self, documents):
+        #Adds documents at the end of the corpus and returns their indices.
+        start = self.corpus_size
+        for document in documents:
+            self._add(document)
+        return list(range(start, self.corpus_size))
+
+    def remove_document(self, index):
+        #Removes the document at index, the following documents move one index down.
+        frequencies = self.doc_freqs.pop(index)
+        self.total_len -= self.doc_len.pop(index)
+        self.corpus_size -= 1
+        for word in frequencies:
+            count = self.doc_count[word] - 1
+            if count:
+                self.doc_count[word] = count
+            else:
+                del self.doc_count[word]
+        self._stale = True
+
+    def update(self):
+        #Recomputes average length and idf after documents were added or removed.
+        if self.corpus_size == 0 or not self.doc_count:
+            self.avgdl = float(self.total_len) / self.corpus_size if self.corpus_size else 0
+            self.idf = {}
+            self.average_idf = 0
+        else:
+            self.avgdl = float(self.total_len) / self.corpus_size
+            self._set_idf(self.doc_count)
+        self._stale = False
+
+    def get_score(self, document, index):
+        if self._stale:
+            self.update()
+        return super(IncrementalBM25, self).get_score(document, index)
+
+    def get_scores(self, document):
+        if self._stale:
+            self.update()
+        return super(IncrementalBM25, self).get_scores(document)
+
+    def get_scores_bow(self, document):
+        if self._stale:
+            self.update()
+        return super(IncrementalBM25, self).get_scores_bow(document)
+
+    def save(self, path):
+        if self._stale:
+            self.update()
+        super(IncrementalBM25, self).save(path)
+
+
+class InvertedBM25(BM25):
+    #BM25 with an inverted index: every word points to the ascending indices of the documents that
+    #contain it and to its term weight in each of them. Top n queries only walk the postings of the
+    #query words and skip, MaxScore style, the documents whose score cannot reach the top n.
+    def __init__(self, corpus, background_idf=None, background_weight=1.0):
+        super(InvertedBM25, self).__init__(corpus, background_idf, background_weight)
+        self.postings = {}
+        for index, frequencies in enumerate(self.doc_freqs):
+            norm = PARAM_K1 * (1 - PARAM_B + PARAM_B * self.doc_len[index] / self.avgdl)
+            for word, freq in iteritems(frequencies):
+                if word not in self.postings:
+                    self.postings[word] = ([], [])
+                indices, weights = self.postings[word]
+                indices.append(index)
+                weights.append(self.idf[word] * freq * (PARAM_K1 + 1) / (freq + norm))
+        #highest weight of every word, bounds the score a word can add to any document
+        self.max_weights = dict((word, max(weights)) for word, (indices, weights) in iteritems(self.postings))
+
+    def get_top_n(self, document, n=5):
+        #Returns the n (index, score) pairs with the highest positive scores, best first, ties by index.
+        counts = {}
+        for word in document:
+            if word in self.postings:
+                counts[word] = counts.get(word, 0) + 1
+        terms = [
+            (self.postings[word][0], self.postings[word][1], count, count * max(self.max_weights[word], 0))
+            for word, count in iteritems(counts)]
+        return _max_score_top_n(terms, n)
+
+
+def _max_score_top_n(terms, n):
+    #terms are (indices, weights, multiplier, upper bound) postings of the query words.
+    if n <= 0 or not terms:
+        return []
+    terms.sort(key=lambda term: term[3])
+    # bounds[t] is the most the terms 0..t together can add to a score
+    bounds = []
+    total = 0
+    for term in terms:
+        total += term[3]
+        bounds.append(total)
+
+    top = []  # min-heap of (score, -index), the worst of the current top n first
+    threshold = 0
+    # terms[essential:] are the essential terms, a document has to be in one of them to beat threshold
+    essential = 0
+    positions = [0] * len(terms)
+    while True:
+        candidate = None
+        for t in range(essential, len(terms)):
+            indices = terms[t][0]
+            if positions[t] < len(indices) and (candidate is None or indices[positions[t]] < candidate):
+                candidate = indices[positions[t]]
+        if candidate is None:
+            break
+
+        score = 0
+        for t in range(essential, len(terms)):
+            indices, weights, multiplier, bound = terms[t]
+            position = positions[t]
+            if position < len(indices) and indices[position] == candidate:
+                score += multiplier * weights[position]
+                positions[t] = position + 1
+
+        # the non essential terms are looked up, highest bound first, while the document can still make it
+        for t in range(essential - 1, -1, -1):
+            if score + bounds[t] <= threshold:
+                break
+            indices, weights, multiplier, bound = terms[t]
+            position = bisect_left(indices, candidate, positions[t])
+            positions[t] = position
+            if position < len(indices) and indices[position] == candidate:
+                score += multiplier * weights[position]
+
+        if score <= threshold:
+            continue
+        if len(top) < n:
+            heapq.heappush(top, (score, -candidate))
+        else:
+            heapq.heapreplace(top, (score, -candidate))
+        if len(top) == n:
+            threshold = top[0][0]
+            while essential < len(terms) and bounds[essential] <= threshold:
+                essential += 1
+
+    return [(-index, score) for score, index in sorted(top, reverse=True)]
+
+
+class SparseBM25(BM25):
+    #BM25 over a CSR term-document matrix, the weights of every (document, term) pair are computed once
+    #so that scoring many queries at the same time is a sparse matrix product.
+    def __init__(self, corpus, background_idf=None, background_weight=1.0):
+        super(SparseBM25, self).__init__(corpus, background_idf, background_weight)
+        self.vocabulary = {word: i for i, word in enumerate(self.idf)}
+        self.term_frequencies = self._build_term_frequencies()
+        self.weights = self._build_weights()
+        #transposed copy, so that query x document products stay in CSR format
+        self.weights_t = self.weights.T.tocsr()
+
+    @classmethod
+    def from_bow_matrix(cls, matrix, background_idf=None, background_weight=1.0):
+        #Builds the model of the documents x ids CSR matrix of counts of a corpus of bags of words, e.g. from
+        #hashing.bow_matrix, with array operations only. As for the corpus of doc2bow lists, the words are
+        #the (id, count) pairs, so the scores are the ones of SparseBM25 of that corpus. doc_freqs is None.
+        matrix = csr_matrix(matrix)
+        matrix.sum_duplicates()
+        # one unsigned key per (id, count) pair, ids of 32 bit hashes do not fit below the sign bit of int64
+        keys = matrix.indices.astype(numpy.uint64) << numpy.uint64(32) | matrix.data.astype(numpy.uint64)
+        words, terms = numpy.unique(keys, return_inverse=True)
+        model = cls.__new__(cls)
+        model.corpus_size = matrix.shape[0]
+        model.doc_freqs = None
+        model.doc_len = numpy.diff(matrix.indptr).astype(numpy.float64)
+        model.avgdl = model.doc_len.sum() / model.corpus_size
+        model.background_idf = background_idf
+        model.background_weight = background_weight
+
+        idf = _idf_values(numpy.bincount(terms, minlength=len(words)), model.corpus_size)
+        if background_idf is not None:
+            background = background_idf.lookup((words >> numpy.uint64(32)).astype(numpy.int64))
+            idf = background_weight * background + (1 - background_weight) * idf
+        model.average_idf = float(idf.mean()) if len(idf) else 0.0
+        pairs = list(zip((words >> numpy.uint64(32)).tolist(), (words & numpy.uint64(0xFFFFFFFF)).tolist()))
+        model.vocabulary = dict((word, i) for i, word in enumerate(pairs))
+        model.idf = dict(zip(pairs, idf.tolist()))
+
+        model.term_frequencies = csr_matrix((numpy.ones(len(terms)), terms, matrix.indptr.copy()),
+                                            shape=(model.corpus_size, len(words)))
+        model.weights = _bm25_weight_matrix(model.term_frequencies, idf, model.doc_len, model.avgdl)
+        model.weights_t = model.weights.T.tocsr()
+        return model
+
+    def _build_term_frequencies(self):
+        #Builds the documents x terms matrix of raw term counts.
+        return _term_frequency_matrix(self.doc_freqs, self.vocabulary)
+
+    def _build_weights(self):
+        #Builds the documents x terms matrix of BM25 term weights, queries only have to count their terms.
+        idf = numpy.empty(len(self.vocabulary))
+        for word, i in iteritems(self.vocabulary):
+            idf[i] = self.idf[word]
+        return _bm25_weight_matrix(self.term_frequencies, idf, numpy.asarray(self.doc_len, dtype=numpy.float64),
+                                   self.avgdl)
+
+    def query_matrix(self, documents):
+        #Returns queries x terms matrix of term counts, words out of the vocabulary are dropped.
+        indptr = [0]
+        indices = []
+        vocabulary = self.vocabulary
+        for document in documents:
+            indices.extend(vocabulary[word] for word in document if word in vocabulary)
+            indptr.append(len(indices))
+        data = numpy.ones(len(indices))
+        matrix = csr_matrix(
+            (data, numpy.asarray(indices, dtype=numpy.int64), indptr),
+            shape=(len(indptr) - 1, len(vocabulary)))
+        # repeated words of a query are summed up into counts
+        matrix.sum_duplicates()
+        return matrix
+
+    def get_scores_matrix(self, documents=None, dense=False):
+        #Returns queries x documents matrix of scores, the corpus is scored against itself when documents is None.
+        queries = self.term_frequencies if documents is None else self.query_matrix(documents)
+        scores = queries.dot(self.weights_t)
+        if dense:
+            return scores.toarray()
+        scores.sort_indices()
+        return scores
+
+    def get_score(self, document, index):
+        # weight of every query word in document index, found by bisection in the postings of the word
+        score = 0
+        weights_t = self.weights_t
+        for word in document:
+            term = self.vocabulary.get(word)
+            if term is None:
+                continue
+            start, end = weights_t.indptr[term], weights_t.indptr[term + 1]
+            position = start + numpy.searchsorted(weights_t.indices[start:end], index)
+            if position < end and weights_t.indices[position] == index:
+                score += weights_t.data[position]
+        return float(score)
+
+    def get_scores(self, document):
+        return self.get_scores_matrix([document], dense=True)[0].tolist()
+
+    def get_scores_bow(self, document):
+        return _sparse_row_to_bow(self.get_scores_matrix([document]), 0)
+
+
+class BackgroundIDF(object):
+    #Idf of a background collection, e.g. an archive, by hashed term id (see hashing.py), kept as one array
+    #of 2 ** bits values. Given to BM25, it replaces or blends with the idf of the corpus, so that the weights
+    #of a short text do not only depend on its own few sentences. Words are looked up by their hash when they
+    #are strings, else by their integer id, or the id of an (id, count) pair, which have to be hashed ids.
+    def __init__(self, idf):
+        self.idf = idf
+        self._fingerprint = None
+        self.bits = len(idf).bit_length() - 1
+        if len(idf) != 1 << self.bits:
+            raise ValueError("Background idf table size must be a power of 2, got %d" % len(idf))
+
+    def __len__(self):
+        return len(self.idf)
+
+    @classmethod
+    def from_documents(cls, documents, bits=HASH_BITS):
+        #Builds the table of documents, lists of tokens.
+        doc_freqs = numpy.zeros(1 << bits, dtype=numpy.int64)
+        corpus_size = 0
+        block = []
+        for document in documents:
+            block.append(document)
+            if len(block) == BACKGROUND_BLOCK_SIZE:
+                doc_freqs += _hashed_document_frequencies(block, bits)
+                corpus_size += len(block)
+                block = []
+        if block:
+            doc_freqs += _hashed_document_frequencies(block, bits)
+            corpus_size += len(block)
+        return cls.from_document_frequencies(doc_freqs, corpus_size)
+
+    @classmethod
+    def from_document_frequencies(cls, doc_freqs, corpus_size):
+        #Builds the table of the number of documents of every hashed id among corpus_size documents, with the
+        #idf of BM25, negative idfs get EPSILON times the average idf of the ids that occur.
+        doc_freqs = numpy.asarray(doc_freqs, dtype=numpy.float64)
+        seen = doc_freqs > 0
+        idf = numpy.log(corpus_size - doc_freqs + 0.5) - numpy.log(doc_freqs + 0.5)
+        # the floor is relative to the ids that occur, as in BM25
+        idf[seen] = _idf_values(doc_freqs[seen], corpus_size)
+        return cls(idf)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        #Opens a table saved with save, memory mapped by default.
+        return cls(numpy.load(path, mmap_mode='r' if mmap else None))
+
+    def save(self, path):
+        # the .npy extension is added as numpy.save does
+        path = os.fspath(path)
+        if not path.endswith('.npy'):
+            path += '.npy'
+        with _replacing(path) as fout:
+            numpy.save(fout, numpy.asarray(self.idf))
+
+    def fingerprint(self):
+        #Returns the hex digest of the values of the table, computed once, e.g. for cache keys.
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.sha1(numpy.ascontiguousarray(self.idf).tobytes()).hexdigest()
+        return self._fingerprint
+
+    def term_ids(self, words):
+        #Returns the array of the table ids of words, all of the type of the first one, or of an array of ids.
+        if isinstance(words, numpy.ndarray):
+            return words.astype(numpy.int64) & (len(self.idf) - 1)
+        words = list(words)
+        if words and isinstance(words[0], string_types):
+            return hash_tokens(words, self.bits)
+        ids = numpy.fromiter((word[0] if isinstance(word, tuple) else word for word in words), dtype=numpy.int64,
+                             count=len(words))
+        return ids & (len(self.idf) - 1)
+
+    def lookup(self, words):
+        #Returns the array of the background idf of words.
+        return numpy.asarray(self.idf[self.term_ids(words)], dtype=numpy.float64)
+
+
+def _hashed_document_frequencies(documents, bits):
+    # every hashed id counts once per document
+    lengths = numpy.fromiter((len(document) for document in documents), dtype=numpy.int64, count=len(documents))
+    ids = hash_tokens([token for document in documents for token in document], bits)
+    keys = numpy.unique(numpy.repeat(numpy.arange(len(documents), dtype=numpy.int64), lengths) << bits | ids)
+    return numpy.bincount(keys & ((1 << bits) - 1), minlength=1 << bits)
 
 
-def _get_scores(bm25, document):
-    return bm25.get_scores(document)
+class MappedBM25(SparseBM25):
+    #SparseBM25 opened from the arrays of a saved model, memory mapped by default, so that loading does not
+    #depend on the size of the corpus and processes that load the same model share its pages. idf and doc_len
+    #are arrays by term and document id, vocabulary maps words to term ids by bisection of the sorted words.
+    #Scores are the ones of the model that was saved, the model itself can not change.
+    def __init__(self, arrays, corpus_size, avgdl, average_idf):
+        self.corpus_size = corpus_size
+        self.avgdl = avgdl
+        self.average_idf = average_idf
+        self.idf = arrays['idf']
+        self.doc_len = arrays['doc_len']
+        self.vocabulary = _MappedVocabulary(arrays['vocabulary'], arrays['vocabulary_offsets'])
+        self.term_frequencies = _csr_from_arrays(arrays, 'tf', (corpus_size, len(self.vocabulary)))
+        self.weights_t = _csr_from_arrays(arrays, 'weights_t', (len(self.vocabulary), corpus_size))
+        self._arrays = arrays
+        self._weights = None
+        self.path = None
 
+    @classmethod
+    def load(cls, path, mmap=True):
+        #Opens the model saved in directory path, its arrays are read in memory when mmap is False.
+        with open(os.path.join(path, MODEL_META)) as fin:
+            meta = json.load(fin)
+        if meta.get('version') != MODEL_FORMAT_VERSION:
+            raise ValueError("Unsupported BM25 model version %r in %s" % (meta.get('version'), path))
+        arrays = dict((name, numpy.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None))
+                      for name in MODEL_ARRAYS)
+        model = cls(arrays, meta['corpus_size'], meta['avgdl'], meta['average_idf'])
+        model.path = path
+        return model
 
-def iter_bm25_bow(corpus, n_jobs=1):
-    bm25 = BM25(corpus)
+    @property
+    def weights(self):
+        # documents x terms, only built when first asked for
+        if self._weights is None:
+            self._weights = self.weights_t.T.tocsr()
+        return self._weights
+
+    def get_idf(self, word, default=None):
+        index = self.vocabulary.get(word)
+        return default if index is None else float(self.idf[index])
+
+    def save(self, path):
+        # the files of the model are mapped, they are not written over
+        if self.path is not None and os.path.isdir(path) and os.path.samefile(path, self.path):
+            return
+        _save_model(path, self._arrays, self.corpus_size, self.avgdl, self.average_idf)
+
+
+class _MappedWords(object):
+    # the words of a utf8 blob as a sequence, decoded on access. Plain views of the arrays, slices of a
+    # numpy memmap are much slower to build.
+    def __init__(self, blob, offsets):
+        self._blob = memoryview(blob.view(numpy.ndarray))
+        self._offsets = offsets.view(numpy.ndarray)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes().decode('utf8')
+
+
+class _MappedVocabulary(Mapping):
+    def __init__(self, blob, offsets):
+        self._words = _MappedWords(blob, offsets)
+
+    def __len__(self):
+        return len(self._words)
+
+    def __iter__(self):
+        for i in range(len(self._words)):
+            yield self._words[i]
+
+    def __getitem__(self, word):
+        if isinstance(word, string_types):
+            i = bisect_left(self._words, word)
+            if i < len(self._words) and self._words[i] == word:
+                return i
+        raise KeyError(word)
+
+
+def _idf_values(doc_freqs, corpus_size):
+    # the idf of BM25 of the words of document frequencies doc_freqs, negative ones get EPSILON times the average
+    doc_freqs = numpy.asarray(doc_freqs, dtype=numpy.float64)
+    idf = numpy.log(corpus_size - doc_freqs + 0.5) - numpy.log(doc_freqs + 0.5)
+    if len(idf):
+        idf[idf < 0] = EPSILON * idf.mean()
+    return idf
+
+
+def _term_frequency_matrix(doc_freqs, vocabulary):
+    #Builds the documents x terms matrix of raw term counts of doc_freqs, term ids from vocabulary.
+    indptr = [0]
+    indices = []
+    data = []
+    for frequencies in doc_freqs:
+        for word, freq in iteritems(frequencies):
+            indices.append(vocabulary[word])
+            data.append(freq)
+        indptr.append(len(indices))
+    return csr_matrix(
+        (numpy.asarray(data, dtype=numpy.float64), numpy.asarray(indices, dtype=numpy.int64), indptr),
+        shape=(len(doc_freqs), len(vocabulary)))
+
+
+def _bm25_weight_matrix(tf, idf, doc_len, avgdl):
+    #Returns the BM25 term weights of the documents x terms matrix of counts tf.
+    rows = numpy.repeat(numpy.arange(tf.shape[0]), numpy.diff(tf.indptr))
+    norm = PARAM_K1 * (1 - PARAM_B + PARAM_B * doc_len[rows] / avgdl)
+    data = idf[tf.indices] * tf.data * (PARAM_K1 + 1) / (tf.data + norm)
+    return csr_matrix((data, tf.indices.copy(), tf.indptr.copy()), shape=tf.shape)
+
+
+def _csr_arrays(prefix, matrix):
+    # indices and indptr of the same dtype, int32 when it fits, else scipy copies them when they are loaded
+    matrix.sort_indices()
+    dtype = numpy.int32 if max(matrix.nnz, max(matrix.shape)) < 2 ** 31 else numpy.int64
+    return {prefix + '_data': matrix.data, prefix + '_indices': matrix.indices.astype(dtype),
+            prefix + '_indptr': matrix.indptr.astype(dtype)}
+
+
+def _csr_from_arrays(arrays, prefix, shape):
+    return csr_matrix((arrays[prefix + '_data'], arrays[prefix + '_indices'], arrays[prefix + '_indptr']),
+                      shape=shape, copy=False)
+
+
+def _save_model(path, arrays, corpus_size, avgdl, average_idf):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    meta_path = os.path.join(path, MODEL_META)
+    # a directory without meta.json is not a model, an interrupted save is never loaded
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for name in MODEL_ARRAYS:
+        with _replacing(os.path.join(path, name + '.npy')) as fout:
+            numpy.save(fout, numpy.asarray(arrays[name]))
+    meta = {'version': MODEL_FORMAT_VERSION, 'corpus_size': corpus_size, 'avgdl': avgdl,
+            'average_idf': average_idf, 'terms': len(arrays['idf']), 'k1': PARAM_K1, 'b': PARAM_B,
+            'epsilon': EPSILON}
+    with _replacing(meta_path) as fout:
+        fout.write(json.dumps(meta, indent=2, sort_keys=True).encode('utf8'))
+
+
+@contextmanager
+def _replacing(path):
+    # the file is written under a temporary name next to path, then renamed over it: processes that mapped
+    # the previous file keep reading it, it is never truncated under them
+    handle, temporary = tempfile.mkstemp(prefix='.' + os.path.basename(path), suffix='.tmp',
+                                         dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(handle, 'wb') as fout:
+            yield fout
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def _sparse_row_to_bow(scores, row):
+    start, end = scores.indptr[row], scores.indptr[row + 1]
+    indices = scores.indices[start:end]
+    data = scores.data[start:end]
+    positive = data > 0
+    return list(zip(indices[positive].tolist(), data[positive].tolist()))
+
+
+def _iter_sparse_bow(bm25):
+    for start in range(0, bm25.corpus_size, SPARSE_BLOCK_SIZE):
+        scores = bm25.term_frequencies[start:start + SPARSE_BLOCK_SIZE].dot(bm25.weights_t)
+        scores.sort_indices()
+        for row in range(scores.shape[0]):
+            yield _sparse_row_to_bow(scores, row)
+
+
+class _SharedModel(object):
+    #The CSR matrices of a SparseBM25 copied once into shared memory. Scoring tasks only carry the
+    #names of the blocks and a range of sentences, workers map the blocks instead of unpickling the model.
+    def __init__(self, bm25, output=False):
+        self._blocks = []
+        arrays = {}
+        for prefix, matrix in (('queries', bm25.term_frequencies), ('weights_t', bm25.weights_t)):
+            arrays[prefix + '_data'] = matrix.data
+            arrays[prefix + '_indices'] = matrix.indices
+            arrays[prefix + '_indptr'] = matrix.indptr
+        if output:
+            arrays['output'] = numpy.zeros((bm25.corpus_size, bm25.corpus_size))
+        self.spec = {
+            'token': uuid.uuid4().hex,
+            'queries_shape': bm25.term_frequencies.shape,
+            'weights_t_shape': bm25.weights_t.shape,
+            'arrays': dict((key, self._share(array)) for key, array in iteritems(arrays)),
+        }
+        self.corpus_size = bm25.corpus_size
+
+    def _share(self, array):
+        from multiprocessing import shared_memory
+        # creating and unlinking a block take the lock of the resource tracker. A worker forked meanwhile
+        # would inherit it held, so both are done under _pool_lock, which is held while pools fork
+        with _pool_lock:
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._blocks.append(block)
+        numpy.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        return block.name, array.shape, array.dtype.str
+
+    def output(self):
+        name, shape, dtype = self.spec['arrays']['output']
+        block = [block for block in self._blocks if block.name == name][0]
+        return numpy.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+
+    def tasks(self, n_processes):
+        # a few chunks per process so that uneven sentences do not leave workers idle
+        n_chunks = n_processes * PARALLEL_CHUNKS_PER_PROCESS
+        chunksize = max(int(math.ceil(self.corpus_size / float(n_chunks))), 1)
+        for start in range(0, self.corpus_size, chunksize):
+            yield self.spec, start, min(start + chunksize, self.corpus_size)
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            with _pool_lock:
+                block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+#model mapped by the current worker process: token, shared memory blocks and matrices. The output block is
+#not part of it, it is mapped by every task that writes to it and closed when the task ends
+_worker_model = {}
+
+
+def _attach_model(spec):
+    if _worker_model.get('token') == spec['token']:
+        return _worker_model
+    from multiprocessing import shared_memory
+    _release_model()
+    blocks = []
+    arrays = {}
+    for key, (name, shape, dtype) in iteritems(spec['arrays']):
+        if key == 'output':
+            continue
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        arrays[key] = numpy.ndarray(shape, dtype=dtype, buffer=block.buf)
+    for prefix in ('queries', 'weights_t'):
+        _worker_model[prefix] = csr_matrix(
+            (arrays[prefix + '_data'], arrays[prefix + '_indices'], arrays[prefix + '_indptr']),
+            shape=spec[prefix + '_shape'], copy=False)
+    _worker_model['blocks'] = blocks
+    _worker_model['token'] = spec['token']
+    return _worker_model
+
+
+def _release_model():
+    blocks = _worker_model.get('blocks', [])
+    # the arrays viewing the blocks have to go before the blocks can be closed
+    _worker_model.clear()
+    for block in blocks:
+        block.close()
+
+
+def _score_chunk(task):
+    spec, start, end = task
+    model = _attach_model(spec)
+    scores = model['queries'][start:end].dot(model['weights_t'])
+    if 'output' in spec['arrays']:
+        from multiprocessing import shared_memory
+        name, shape, dtype = spec['arrays']['output']
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            numpy.ndarray(shape, dtype=dtype, buffer=block.buf)[start:end] = scores.toarray()
+        finally:
+            block.close()
+        return None
+    scores.data[scores.data <= 0] = 0
+    scores.eliminate_zeros()
+    scores.sort_indices()
+    return scores.indptr, scores.indices, scores.data
+
+
+#shared scoring pools by number of processes, a pool is never terminated while another call may be using it
+_pools = {}
+_pools_pid = None
+_pool_lock = threading.Lock()
+
+
+def _prepare_workers():
+    # a worker forked while another thread holds the lock of a module it still has to import waits on
+    # it forever. Everything _score_chunk imports, including the lazy imports of scipy.sparse, is
+    # loaded here before the fork
+    from multiprocessing import shared_memory  # noqa:F401
+    scores = csr_matrix(numpy.ones((2, 2)))[:1].dot(csr_matrix(numpy.ones((2, 2))))
+    scores.toarray()
+    scores.data[scores.data <= 0] = 0
+    scores.eliminate_zeros()
+    scores.sort_indices()
+
+
+def get_scoring_pool(n_processes):
+    #Returns the process pool of n_processes workers shared by all parallel scoring calls, it is created on
+    #first use. Calls with different numbers of processes get different pools.
+    global _pools_pid
+    import multiprocessing
+    from multiprocessing import resource_tracker
+    with _pool_lock:
+        if _pools_pid != os.getpid():
+            # a forked child inherits the references but not the workers
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(n_processes)
+        if pool is None:
+            # workers have to share the tracker of this process, else each of them starts its own one
+            # which unlinks the blocks it attached to when the worker exits
+            resource_tracker.ensure_running()
+            _prepare_workers()
+            pool = _pools[n_processes] = multiprocessing.Pool(n_processes)
+        return pool
+
+
+def close_scoring_pool():
+    #Terminates the shared scoring pools, the next parallel call starts a new one. Calls still scoring in
+    #them fail, this is meant for the end of the program.
+    with _pool_lock:
+        _close_pools()
+
+
+def _close_pools():
+    if _pools_pid == os.getpid():
+        for pool in _pools.values():
+            pool.terminate()
+            pool.join()
+    _pools.clear()
+
+
+atexit.register(close_scoring_pool)
+
+
+def _use_pool(bm25, n_jobs):
     n_processes = effective_n_jobs(n_jobs)
-    if n_processes == 1:
-        for doc in corpus:
-            yield bm25.get_scores_bow(doc)
+    if n_processes == 1 or bm25.corpus_size < PARALLEL_MIN_DOCUMENTS:
+        return 1
+    return n_processes
+
+
+def _iter_parallel_bow(bm25, n_processes):
+    pool = get_scoring_pool(n_processes)
+    with _SharedModel(bm25) as model:
+        for indptr, indices, data in pool.imap(_score_chunk, model.tasks(n_processes)):
+            for row in range(len(indptr) - 1):
+                start, end = indptr[row], indptr[row + 1]
+                yield list(zip(indices[start:end].tolist(), data[start:end].tolist()))
+
+
+def _parallel_weights(bm25, n_processes):
+    pool = get_scoring_pool(n_processes)
+    with _SharedModel(bm25, output=True) as model:
+        pool.map(_score_chunk, model.tasks(n_processes))
+        return model.output().tolist()
+
+
+def iter_bm25_bow(corpus, n_jobs=1, sparse=False, background_idf=None, background_weight=1.0):
+    #With n_jobs > 1 the sparse engine is spread over the shared scoring pool in sentence ranges.
+    #background_idf and background_weight are the ones of BM25.
+    if sparse or effective_n_jobs(n_jobs) > 1:
+        bm25 = SparseBM25(corpus, background_idf, background_weight)
+        n_processes = _use_pool(bm25, n_jobs)
+        bows = _iter_sparse_bow(bm25) if n_processes == 1 else _iter_parallel_bow(bm25, n_processes)
+        for bow in bows:
+            yield bow
         return
-    
-    get_score = partial(_get_scores_bow, bm25)
-    pool = Pool(n_processes)
 
-    for bow in pool.imap(get_score, corpus):
-        yield bow
-    pool.close()
-    pool.join()
+    bm25 = BM25(corpus, background_idf, background_weight)
+    for doc in corpus:
+        yield bm25.get_scores_bow(doc)
 
 
-def get_bm25_weights(corpus, n_jobs=1):
-    bm25 = BM25(corpus)
-    n_processes = effective_n_jobs(n_jobs)
-    if n_processes == 1:
-        weights = [bm25.get_scores(doc) for doc in corpus]
-        return weights
-    
-    get_score = partial(_get_scores, bm25)
-    pool = Pool(n_processes)
-    weights = pool.map(get_score, corpus)
-    pool.close()
-    pool.join()
-    return weights
\ No newline at end of file
+def get_bm25_weights(corpus, n_jobs=1, sparse=False, background_idf=None, background_weight=1.0):
+    #With n_jobs > 1 the sparse engine is spread over the shared scoring pool in sentence ranges.
+    if sparse or effective_n_jobs(n_jobs) > 1:
+        bm25 = SparseBM25(corpus, background_idf, background_weight)
+        n_processes = _use_pool(bm25, n_jobs)
+        if n_processes == 1:
+            return bm25.get_scores_matrix(dense=True).tolist()
+        return _parallel_weights(bm25, n_processes)
+
+    bm25 = BM25(corpus, background_idf, background_weight)
+    weights = [bm25.get_scores(doc) for doc in corpus]
+    return weights
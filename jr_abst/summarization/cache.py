@@ -0,0 +1,134 @@
+#cache
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAXSIZE = 1024
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'disk_hits', 'maxsize', 'currsize', 'currbytes'])
+
+
+def make_key(text, ratio=0.2, word_count=None, split=False, **options):
+    #Returns the hex digest that identifies the summary of text with the given parameters. Options that
+    #change the summary (e.g. top_k, approximate) only enter the key when set, so keys of summaries
+    #computed without them stay valid. The text is hashed as given: summaries are slices of it, and line
+    #breaks and runs of spaces change where its sentences end.
+    digest = hashlib.sha1(text.encode('utf8'))
+    digest.update(repr((ratio, word_count, bool(split))).encode('utf8'))
+    options = sorted((name, value) for name, value in options.items() if value is not None and value is not False)
+    if options:
+        digest.update(repr(options).encode('utf8'))
+    return digest.hexdigest()
+
+
+def _summary_size(summary):
+    if isinstance(summary, list):
+        return sum(len(sentence.encode('utf8')) for sentence in summary)
+    return len(summary.encode('utf8'))
+
+
+class SummaryCache(object):
+    #Cache of summaries by make_key. The memory tier keeps the maxsize most recently used summaries,
+    #and at most maxbytes of summary text when maxbytes is given. With a directory, every summary is also
+    #written there and read back on a memory miss, so the cache survives restarts. The disk tier is
+    #not evicted.
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, maxbytes=None, directory=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or (self.directory is not None and os.path.exists(self._path(key)))
+
+    def get(self, key, default=None):
+        #Returns the summary stored for key, or default.
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(self._entries[key][0])
+        summary = self._load(key)
+        with self._lock:
+            if summary is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, summary)
+        return _copy(summary)
+
+    def put(self, key, summary):
+        #Stores summary for key in every tier.
+        with self._lock:
+            self._store(key, _copy(summary))
+        self._dump(key, summary)
+
+    def clear(self):
+        #Empties the memory tier and resets the counters, the disk tier is kept.
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.disk_hits = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.disk_hits, self.maxsize, len(self._entries), self._bytes)
+
+    def _store(self, key, summary):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        size = _summary_size(summary)
+        self._entries[key] = (summary, size)
+        self._bytes += size
+        # evicts the least recently used entries
+        while self._entries and (len(self._entries) > self.maxsize
+                                 or (self.maxbytes is not None and self._bytes > self.maxbytes)):
+            self._bytes -= self._entries.popitem(last=False)[1][1]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as fin:
+                return json.loads(fin.read().decode('utf8'))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _dump(self, key, summary):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # written aside and renamed, readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as fout:
+                fout.write(json.dumps(summary).encode('utf8'))
+            os.replace(tmp_path, path)
+        except (IOError, OSError) as error:
+            logger.warning("Could not write summary to cache directory %s: %s", self.directory, error)
+
+
+def _copy(summary):
+    # callers may change the list they get, the cached one must not
+    return list(summary) if isinstance(summary, list) else summary
@@ -10,6 +10,5 @@ def build_graph(sequence):
 
 
 def remove_unreachable_nodes(graph):
-    for node in graph.nodes():
-        if all(graph.edge_weight((node, other)) == 0 for other in graph.neighbors(node)):
-            graph.del_node(node)
\ No newline at end of file
+    # the nodes without non zero edges are found on the degrees array, and removed at once
+    graph.del_isolated_nodes()
@@ -1,5 +1,7 @@
 #graph
 from abc import ABCMeta, abstractmethod
+import numpy
+from scipy.sparse import csr_matrix
 
 class IGraph(object):
     __metaclass__ = ABCMeta
@@ -45,6 +47,14 @@ class IGraph(object):
         #Removes node and its edges from the graph.
         pass
 
+    def degrees(self):
+        #Returns array with the number of non zero edges of every node, in nodes() order.
+        pass
+
+    def del_isolated_nodes(self):
+        #Removes all nodes that have no non zero edge.
+        pass
+
 
 class Graph(IGraph):
     #Implementing the undirected graph, based on IGraph.
@@ -103,6 +113,17 @@ class Graph(IGraph):
         #Returns all nodes of the graph.
         return list(self.node_neighbors)
 
+    def degrees(self):
+        #Returns array with the number of non zero edges of every node, zero weights are never stored.
+        return numpy.fromiter((len(neighbors) for neighbors in self.node_neighbors.values()),
+                              dtype=numpy.int64, count=len(self.node_neighbors))
+
+    def del_isolated_nodes(self):
+        #Removes all nodes that have no non zero edge, they have no edge to update.
+        isolated = [node for node, degree in zip(self.nodes(), self.degrees()) if degree == 0]
+        for node in isolated:
+            del self.node_neighbors[node]
+
     def edges(self):
         #Returns all edges of the graph.
         return list(self.iter_edges())
@@ -125,4 +146,159 @@ class Graph(IGraph):
         u, v = edge
         del self.node_neighbors[u][v]
         if u != v:
-            del self.node_neighbors[v][u]
\ No newline at end of file
+            del self.node_neighbors[v][u]
+
+
+class ArrayGraph(IGraph):
+    #Implementing the undirected graph, based on IGraph, with a symmetric CSR adjacency matrix.
+    #Node i of the graph is row and column i of the matrix, so the whole graph can be built,
+    #pruned and handed to pagerank as arrays. Single edge updates are supported but each one
+    #rebuilds the matrix, they are meant for compatibility with Graph, not for filling the graph.
+    DEFAULT_WEIGHT = 0
+
+    def __init__(self, nodes=(), adjacency=None):
+        self._set_nodes(list(nodes))
+        length = len(self._nodes)
+        if adjacency is None:
+            adjacency = csr_matrix((length, length))
+        self.adjacency = csr_matrix(adjacency, dtype=numpy.float64)
+        if self.adjacency.shape != (length, length):
+            raise ValueError("Adjacency matrix of shape %s does not match %d nodes" % (self.adjacency.shape, length))
+        self.adjacency.eliminate_zeros()
+
+    @classmethod
+    def from_matrix(cls, matrix, nodes=None, threshold=0):
+        #Builds the graph from a (possibly asymmetric) square matrix of similarity scores.
+        #Scores below threshold and the diagonal are dropped. The edge (i, j), i < j, gets the score
+        #matrix[i, j] when it is kept, else matrix[j, i]: the weight the first of the two nodes gives.
+        scores = csr_matrix(matrix).tocoo()
+        length = scores.shape[0]
+        if nodes is None:
+            nodes = range(length)
+        row, col, data = scores.row.astype(numpy.int64), scores.col.astype(numpy.int64), scores.data
+        kept = (row != col) & (data > 0) & (data >= threshold)
+        row, col, data = row[kept], col[kept], data[kept]
+
+        upper = row < col
+        lower = ~upper
+        upper_keys = row[upper] * length + col[upper]
+        lower_keys = col[lower] * length + row[lower]
+        # the lower triangle only fills the pairs the upper triangle left empty
+        fill = ~numpy.isin(lower_keys, upper_keys)
+        first = numpy.concatenate((row[upper], col[lower][fill]))
+        second = numpy.concatenate((col[upper], row[lower][fill]))
+        weights = numpy.concatenate((data[upper], data[lower][fill]))
+
+        adjacency = csr_matrix(
+            (numpy.concatenate((weights, weights)),
+             (numpy.concatenate((first, second)), numpy.concatenate((second, first)))),
+            shape=(length, length))
+        return cls(nodes, adjacency)
+
+    def _set_nodes(self, nodes):
+        self._nodes = nodes
+        self._node_ids = {node: i for i, node in enumerate(nodes)}
+        if len(self._node_ids) != len(nodes):
+            raise ValueError("Nodes of the graph must be unique")
+
+    def __len__(self):
+        #Returns number of nodes in graph.
+        return len(self._nodes)
+
+    def degrees(self):
+        #Returns array with the number of non zero edges of every node.
+        return numpy.diff(self.adjacency.indptr)
+
+    def has_edge(self, edge):
+        #Returns whether an edge exists.
+        u, v = edge
+        if u not in self._node_ids or v not in self._node_ids:
+            return False
+        return self.adjacency[self._node_ids[u], self._node_ids[v]] != 0
+
+    def edge_weight(self, edge):
+        #Returns weight of given edge.
+        u, v = edge
+        if u not in self._node_ids or v not in self._node_ids:
+            return self.DEFAULT_WEIGHT
+        return self.adjacency[self._node_ids[u], self._node_ids[v]]
+
+    def neighbors(self, node):
+        #Returns all nodes that are directly accessible from given node.
+        i = self._node_ids[node]
+        adjacency = self.adjacency
+        return [self._nodes[j] for j in adjacency.indices[adjacency.indptr[i]:adjacency.indptr[i + 1]]]
+
+    def has_node(self, node):
+        #Returns whether the requested node exists.
+        return node in self._node_ids
+
+    def add_edge(self, edge, wt=1):
+        #Adds an edge to the graph connecting two nodes.
+        if wt == 0.0:
+            # empty edge is similar to no edge at all or removing it
+            if self.has_edge(edge):
+                self.del_edge(edge)
+            return
+        if self.has_edge(edge):
+            raise ValueError("Edge (%s, %s) already in graph" % edge)
+        self._update_edge(edge, wt)
+
+    def add_node(self, node):
+        #Adds given node to the graph.
+        if node in self._node_ids:
+            raise ValueError("Node %s already in graph" % (node,))
+        self._node_ids[node] = len(self._nodes)
+        self._nodes.append(node)
+        length = len(self._nodes)
+        adjacency = self.adjacency.tocoo()
+        self.adjacency = csr_matrix((adjacency.data, (adjacency.row, adjacency.col)), shape=(length, length))
+
+    def nodes(self):
+        #Returns all nodes of the graph.
+        return list(self._nodes)
+
+    def edges(self):
+        #Returns all edges of the graph.
+        return list(self.iter_edges())
+
+    def iter_edges(self):
+        #Returns iterator of all edges of the graph.
+        adjacency = self.adjacency.tocoo()
+        for i, j in zip(adjacency.row.tolist(), adjacency.col.tolist()):
+            yield (self._nodes[i], self._nodes[j])
+
+    def del_node(self, node):
+        #Removes given node and its edges from the graph.
+        self.del_nodes([node])
+
+    def del_nodes(self, nodes):
+        #Removes given nodes and their edges from the graph, with one rebuild of the matrix.
+        keep = numpy.ones(len(self._nodes), dtype=bool)
+        keep[[self._node_ids[node] for node in nodes]] = False
+        self._keep(keep)
+
+    def del_isolated_nodes(self):
+        #Removes all nodes that have no non zero edge.
+        self._keep(self.degrees() > 0)
+
+    def _keep(self, mask):
+        if mask.all():
+            return
+        self.adjacency = self.adjacency[mask][:, mask]
+        self._set_nodes([node for node, kept in zip(self._nodes, mask) if kept])
+
+    def del_edge(self, edge):
+        #Removes given edges from the graph.
+        if not self.has_edge(edge):
+            raise KeyError(edge)
+        self._update_edge(edge, 0)
+
+    def _update_edge(self, edge, wt):
+        u, v = edge
+        i, j = self._node_ids[u], self._node_ids[v]
+        adjacency = self.adjacency.tolil()
+        adjacency[i, j] = wt
+        adjacency[j, i] = wt
+        self.adjacency = adjacency.tocsr()
+        self.adjacency.eliminate_zeros()
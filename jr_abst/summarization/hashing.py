@@ -0,0 +1,79 @@
+#hashing
+#Stable ids of tokens: the 32 bit FNV-1a hash of their utf8 bytes, xor folded to bits bits. Ids do not
+#depend on a vocabulary, so they are the same in every document, process and run, and statistics indexed
+#by them (e.g. a background idf table) can be computed once and reused. Corpora of hashed ids are CSR
+#matrices of counts with 2 ** bits columns, built without a vocabulary.
+import numpy
+from scipy.sparse import csr_matrix
+
+FNV_OFFSET = 2166136261
+FNV_PRIME = 16777619
+#ids are below 2 ** HASH_BITS
+HASH_BITS = 20
+MAX_HASH_BITS = 32
+
+
+def _check_bits(bits):
+    if not 1 <= bits <= MAX_HASH_BITS:
+        raise ValueError("Hash bits must be between 1 and %d, got %r" % (MAX_HASH_BITS, bits))
+
+
+def _fold(hashes, bits):
+    # the high bits of FNV mix better than the low ones, they are folded in instead of dropped
+    if bits == MAX_HASH_BITS:
+        return hashes
+    return (hashes >> bits) ^ (hashes & ((1 << bits) - 1))
+
+
+def hash_token(token, bits=HASH_BITS):
+    #Returns the id of token, hash_tokens of many tokens is faster.
+    _check_bits(bits)
+    value = FNV_OFFSET
+    for byte in bytearray(token.encode('utf8')):
+        value = ((value ^ byte) * FNV_PRIME) & 0xFFFFFFFF
+    # the fold of 32 bits stays in 32 bits, it is masked again for widths below 16
+    return _fold(value, bits) & ((1 << bits) - 1)
+
+
+def hash_tokens(tokens, bits=HASH_BITS):
+    #Returns the int64 array of the ids of tokens, the same as hash_token of every token. The bytes of all
+    #tokens are hashed together, one vectorized step per byte position of the longest token.
+    _check_bits(bits)
+    encoded = [token.encode('utf8') for token in tokens]
+    if not encoded:
+        return numpy.empty(0, dtype=numpy.int64)
+    lengths = numpy.fromiter((len(token) for token in encoded), dtype=numpy.int64, count=len(encoded))
+    data = numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8).astype(numpy.uint32)
+    # longest tokens first, the tokens still being hashed at a position are then a prefix
+    order = numpy.argsort(-lengths, kind='stable')
+    starts = (numpy.cumsum(lengths) - lengths)[order]
+    lengths = lengths[order]
+    active = numpy.searchsorted(-lengths, -numpy.arange(lengths[0]), side='left')
+    hashes = numpy.full(len(encoded), FNV_OFFSET, dtype=numpy.uint32)
+    prime = numpy.uint32(FNV_PRIME)
+    for position in range(int(lengths[0])):
+        count = active[position]
+        hashes[:count] ^= data[starts[:count] + position]
+        hashes[:count] *= prime
+    result = numpy.empty(len(encoded), dtype=numpy.int64)
+    result[order] = _fold(hashes.astype(numpy.int64), bits) & ((1 << bits) - 1)
+    return result
+
+
+def bow_matrix(indptr, ids, bits=HASH_BITS):
+    #Returns the documents x 2 ** bits CSR matrix of the counts of ids, the ids of document i being
+    #ids[indptr[i]:indptr[i + 1]], sorted by id in every row as doc2bow does.
+    indptr = numpy.asarray(indptr, dtype=numpy.int64)
+    rows = numpy.repeat(numpy.arange(len(indptr) - 1), numpy.diff(indptr))
+    # duplicates are summed up into counts
+    matrix = csr_matrix((numpy.ones(len(rows)), (rows, numpy.asarray(ids, dtype=numpy.int64))),
+                        shape=(len(indptr) - 1, 1 << bits))
+    matrix.sort_indices()
+    return matrix
+
+
+def hashed_bow_matrix(documents, bits=HASH_BITS):
+    #Returns bow_matrix of the hashed ids of documents, lists of tokens.
+    lengths = numpy.fromiter((len(document) for document in documents), dtype=numpy.int64, count=len(documents))
+    ids = hash_tokens([token for document in documents for token in document], bits)
+    return bow_matrix(numpy.concatenate(([0], numpy.cumsum(lengths))), ids, bits)
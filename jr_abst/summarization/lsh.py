@@ -0,0 +1,195 @@
+#lsh
+#Approximate similarity graph for long texts: instead of scoring every pair of sentences, MinHash
+#signatures of the term sets are banded (locality sensitive hashing) and only the sentences that share
+#a bucket in some band are scored. Every sentence then keeps its top k neighbours.
+import logging
+import numpy
+from scipy.sparse import csr_matrix
+from six.moves import range
+
+logger = logging.getLogger(__name__)
+
+#the hash functions are (a * term + b) mod MERSENNE_PRIME, term ids are below 2 ** 31 so that
+#a * term fits in 64 bits
+MERSENNE_PRIME = (1 << 31) - 1
+MINHASH_PERMUTATIONS = 128
+#bands of MINHASH_PERMUTATIONS // LSH_BANDS rows, two sentences of jaccard similarity s become
+#candidates with probability 1 - (1 - s ** rows) ** bands
+LSH_BANDS = 64
+#buckets with more sentences than this come from very common terms and are not paired
+LSH_MAX_BUCKET_SIZE = 200
+TOP_K = 20
+#number of candidate pairs scored per sparse product
+PAIR_BLOCK_SIZE = 1 << 16
+#number of scores of the dense row blocks the top k are selected from
+TOP_K_BLOCK_ELEMENTS = 1 << 22
+#multiplier that folds the rows of a band into one key
+BAND_KEY_MULTIPLIER = 0x9E3779B97F4A7C15 - (1 << 64)
+
+
+def minhash_signatures(term_frequencies, num_perm=MINHASH_PERMUTATIONS, seed=0):
+    #Returns the documents x num_perm array of MinHash values of the term sets of the rows of
+    #term_frequencies (documents x terms). Empty documents get MERSENNE_PRIME everywhere.
+    matrix = csr_matrix(term_frequencies)
+    if matrix.shape[1] >= MERSENNE_PRIME:
+        raise ValueError("MinHash supports vocabularies of less than %d terms" % MERSENNE_PRIME)
+    random_state = numpy.random.RandomState(seed)
+    a = random_state.randint(1, MERSENNE_PRIME, size=num_perm).astype(numpy.int64)
+    b = random_state.randint(0, MERSENNE_PRIME, size=num_perm).astype(numpy.int64)
+
+    signatures = numpy.full((matrix.shape[0], num_perm), MERSENNE_PRIME, dtype=numpy.int64)
+    terms = matrix.indices.astype(numpy.int64)
+    non_empty = numpy.flatnonzero(numpy.diff(matrix.indptr))
+    if len(non_empty) == 0:
+        return signatures
+    starts = matrix.indptr[non_empty]
+    for k in range(num_perm):
+        hashes = (a[k] * terms + b[k]) % MERSENNE_PRIME
+        signatures[non_empty, k] = numpy.minimum.reduceat(hashes, starts)
+    return signatures
+
+
+def _pairs_in_groups(members, sizes):
+    #members are document ids grouped by bucket, sizes the size of each group.
+    #Returns all (first, second) pairs of members of the same group.
+    ends = numpy.repeat(numpy.cumsum(sizes), sizes)
+    positions = numpy.arange(len(members))
+    counts = ends - positions - 1
+    total = counts.sum()
+    if total == 0:
+        return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64)
+    first = numpy.repeat(positions, counts)
+    offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    second = first + 1 + offsets
+    return members[first], members[second]
+
+
+def lsh_candidate_pairs(signatures, bands=LSH_BANDS, max_bucket_size=LSH_MAX_BUCKET_SIZE):
+    #Returns the (first, second) arrays, first < second, of the documents that share a bucket in at
+    #least one band of their signatures. Documents with empty signatures are never candidates.
+    length, num_perm = signatures.shape
+    if num_perm % bands:
+        raise ValueError("%d permutations can not be split in %d bands" % (num_perm, bands))
+    rows = num_perm // bands
+    documents = numpy.flatnonzero(signatures[:, 0] != MERSENNE_PRIME)
+    if len(documents) < 2:
+        return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64)
+    keys = []
+    for band in range(bands):
+        band_keys = _band_keys(signatures[documents, band * rows:(band + 1) * rows])
+        order = numpy.argsort(band_keys, kind='stable')
+        band_keys = band_keys[order]
+        boundaries = numpy.flatnonzero(numpy.diff(band_keys)) + 1
+        sizes = numpy.diff(numpy.concatenate(([0], boundaries, [len(band_keys)])))
+        # members of oversized buckets are dropped, the others keep their grouping
+        kept = (sizes >= 2) & (sizes <= max_bucket_size)
+        members = documents[order][numpy.repeat(kept, sizes)]
+        first, second = _pairs_in_groups(members, sizes[kept])
+        keys.append(first * length + second)
+
+    # sorted and deduplicated by hand, numpy.unique is much slower on tens of millions of keys
+    keys = numpy.concatenate(keys)
+    keys.sort()
+    keys = keys[numpy.concatenate(([True], keys[1:] != keys[:-1]))] if len(keys) else keys
+    return keys // length, keys % length
+
+
+def _band_keys(band_signatures):
+    # rows are folded with wrapping 64 bit arithmetic, distinct bands very rarely collide
+    keys = band_signatures[:, 0].copy()
+    with numpy.errstate(over='ignore'):
+        for j in range(1, band_signatures.shape[1]):
+            keys *= BAND_KEY_MULTIPLIER
+            keys += band_signatures[:, j]
+    return keys
+
+
+def score_pairs(bm25, first, second):
+    #Returns the scores of the queries first against the documents second of a SparseBM25.
+    scores = numpy.empty(len(first))
+    for start in range(0, len(first), PAIR_BLOCK_SIZE):
+        end = start + PAIR_BLOCK_SIZE
+        products = bm25.term_frequencies[first[start:end]].multiply(bm25.weights[second[start:end]])
+        scores[start:end] = numpy.asarray(products.sum(axis=1)).ravel()
+    return scores
+
+
+def _top_k_entries(row, col, data, k):
+    # one sort by row, then by decreasing score: the float32 bits of a positive score grow with it, so
+    # the row and the complemented bits make a single int64 key
+    bits = data.astype(numpy.float32).view(numpy.uint32).astype(numpy.int64)
+    order = numpy.argsort((row << 32) | (0xFFFFFFFF - bits))
+    row, col, data = row[order], col[order], data[order]
+    counts = numpy.bincount(row)
+    starts = numpy.cumsum(counts) - counts
+    kept = numpy.arange(len(row)) - starts[row] < k
+    return row[kept], col[kept], data[kept]
+
+
+def _top_k_block(block, first_row, k, threshold):
+    # block holds the dense rows first_row.. of a square matrix, returns their top k entries
+    n_rows, length = block.shape
+    block[numpy.arange(n_rows), first_row + numpy.arange(n_rows)] = 0
+    block[block < threshold] = 0
+    if k < length:
+        col = numpy.argpartition(block, length - k, axis=1)[:, length - k:]
+    else:
+        col = numpy.broadcast_to(numpy.arange(length), block.shape)
+    data = numpy.take_along_axis(block, col, axis=1)
+    row = numpy.broadcast_to(first_row + numpy.arange(n_rows)[:, None], col.shape)
+    kept = data > 0
+    return row[kept], col[kept], data[kept]
+
+
+def _top_k_csr(blocks, k, threshold, length):
+    rows, cols, data = [], [], []
+    for first_row, block in blocks:
+        block_rows, block_cols, block_data = _top_k_block(block, first_row, k, threshold)
+        rows.append(block_rows)
+        cols.append(block_cols)
+        data.append(block_data)
+    if not rows:
+        return csr_matrix((length, length))
+    return csr_matrix(
+        (numpy.concatenate(data), (numpy.concatenate(rows), numpy.concatenate(cols))), shape=(length, length))
+
+
+def _row_block_size(length):
+    return max(1, TOP_K_BLOCK_ELEMENTS // max(length, 1))
+
+
+def top_k_matrix(matrix, k=TOP_K, threshold=0):
+    #Keeps the k highest scores of every row of a square matrix, the diagonal and the scores below
+    #threshold are dropped first.
+    matrix = csr_matrix(matrix)
+    length = matrix.shape[0]
+    block_size = _row_block_size(length)
+    blocks = ((start, matrix[start:start + block_size].toarray()) for start in range(0, length, block_size))
+    return _top_k_csr(blocks, k, threshold, length)
+
+
+def top_k_scores_matrix(bm25, k=TOP_K, threshold=0):
+    #Returns top_k_matrix of a SparseBM25 corpus scored against itself, without building the whole
+    #matrix of scores: queries are scored and pruned by blocks of rows.
+    length = bm25.corpus_size
+    block_size = _row_block_size(length)
+    blocks = ((start, bm25.term_frequencies[start:start + block_size].dot(bm25.weights_t).toarray())
+              for start in range(0, length, block_size))
+    return _top_k_csr(blocks, k, threshold, length)
+
+
+def approximate_scores_matrix(bm25, k=TOP_K, threshold=0, num_perm=MINHASH_PERMUTATIONS, bands=LSH_BANDS,
+                              max_bucket_size=LSH_MAX_BUCKET_SIZE, seed=0):
+    #Returns the queries x documents matrix of a SparseBM25 corpus scored against itself, restricted to the
+    #LSH candidate pairs (in both directions) and to the k best documents of every query.
+    length = bm25.corpus_size
+    signatures = minhash_signatures(bm25.term_frequencies, num_perm, seed)
+    first, second = lsh_candidate_pairs(signatures, bands, max_bucket_size)
+    logger.info('Scoring %d candidate pairs of %d sentences', len(first), length)
+
+    row = numpy.concatenate((first, second))
+    col = numpy.concatenate((second, first))
+    data = score_pairs(bm25, row, col)
+    kept = (data > 0) & (data >= threshold)
+    row, col, data = _top_k_entries(row[kept], col[kept], data[kept], k)
+    return csr_matrix((data, (row, col)), shape=(length, length))
@@ -0,0 +1,138 @@
+#metrics
+#Instrumentation of the stages of a summary. The functions of summarizer take a metrics callback, it receives
+#one StageMetrics per stage once the stage is done. Without a callback, stage() returns a shared object that
+#does nothing, so disabled metrics cost one function call per stage. Stages do not nest.
+#The memory of a stage is only measured while tracemalloc is tracing, which slows the stages down, so a
+#benchmark times its runs untraced and measures memory in a run of its own:
+#    tracemalloc.start()
+#    summarize(text, metrics=recorder)
+#    tracemalloc.stop()
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict, namedtuple
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+#wall_time and cpu_time in seconds. peak_allocated is the highest memory, in bytes, the stage held allocated on
+#top of what was allocated when it started, as traced by tracemalloc (numpy arrays included), None when
+#tracemalloc is not tracing. process_max_rss is the peak resident memory of the whole process since it
+#started in bytes, not of the stage, None where it is not available. nodes and edges of the graph or the
+#number of units the stage produced.
+StageMetrics = namedtuple('StageMetrics', ['stage', 'wall_time', 'cpu_time', 'peak_allocated', 'process_max_rss',
+                                           'nodes', 'edges'])
+
+
+def peak_memory():
+    #Returns the peak resident memory of the process in bytes, None where it is not available.
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, but bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def count_edges(graph):
+    #Returns the number of undirected edges of a graph.
+    adjacency = getattr(graph, 'adjacency', None)
+    if adjacency is not None:
+        return int(adjacency.nnz // 2)
+    return int(graph.degrees().sum() // 2)
+
+
+def _highest(first, second):
+    # None where a value is not known
+    if first is None or second is None:
+        return second if first is None else first
+    return max(first, second)
+
+
+class _Stage(object):
+    __slots__ = ('callback', 'name', 'nodes', 'edges', 'graph', '_wall', '_cpu', '_allocated')
+
+    def __init__(self, callback, name):
+        self.callback = callback
+        self.name = name
+        self.nodes = None
+        self.edges = None
+        self.graph = None
+
+    def __enter__(self):
+        self._allocated = None
+        if tracemalloc.is_tracing():
+            # the peak of the stage is the one reached after this reset
+            self._allocated = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self._wall
+        cpu_time = time.process_time() - self._cpu
+        # stages that fail are not reported
+        if exc_type is not None:
+            return False
+        peak_allocated = None
+        if self._allocated is not None and tracemalloc.is_tracing():
+            peak_allocated = max(0, tracemalloc.get_traced_memory()[1] - self._allocated)
+        nodes, edges = self.nodes, self.edges
+        if self.graph is not None:
+            nodes, edges = len(self.graph), count_edges(self.graph)
+        self.callback(StageMetrics(self.name, wall_time, cpu_time, peak_allocated, peak_memory(), nodes,
+                                   edges))
+        return False
+
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        # counts given to a disabled stage are dropped, nothing is kept alive
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+def stage(callback, name):
+    #Returns the context manager that times stage name and reports it to callback, which may be None.
+    #Inside, set nodes and edges, or graph to have them counted when the stage ends.
+    if callback is None:
+        return NULL_STAGE
+    return _Stage(callback, name)
+
+
+class MetricsRecorder(object):
+    #Metrics callback that keeps every StageMetrics it receives.
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, metrics):
+        self.records.append(metrics)
+
+    def clear(self):
+        self.records = []
+
+    def totals(self):
+        #Returns the StageMetrics of every stage summed over the records, in order of first appearance:
+        #times add up, peak_allocated and process_max_rss are the highest seen, nodes and edges are the last ones.
+        totals = OrderedDict()
+        for record in self.records:
+            total = totals.get(record.stage)
+            if total is None:
+                totals[record.stage] = record
+                continue
+            totals[record.stage] = StageMetrics(
+                record.stage, total.wall_time + record.wall_time, total.cpu_time + record.cpu_time,
+                _highest(total.peak_allocated, record.peak_allocated),
+                _highest(total.process_max_rss, record.process_max_rss), record.nodes, record.edges)
+        return totals
@@ -1,15 +1,42 @@
 #pagerank_weighted
+import logging
 import numpy
 from numpy import empty as empty_matrix
-from scipy.linalg import eig
-from scipy.sparse import csr_matrix
-from scipy.sparse.linalg import eigs
+from scipy.sparse import csc_matrix, csr_matrix, diags
 from six.moves import range
-from jr_abst.utils import deprecated
+from jr_abst.summarization.utils import deprecated
+from jr_abst.summarization.graph import ArrayGraph
 
+#convergence control of the sparse power iteration
+PAGERANK_TOL = 1.e-8
+PAGERANK_MAX_ITER = 200
+logger = logging.getLogger(__name__)
 
-def pagerank_weighted(graph, damping=0.85):
+
+def pagerank_weighted(graph, damping=0.85, sparse=False, tol=PAGERANK_TOL, max_iter=PAGERANK_MAX_ITER, start=None):
     #Get dictionary of graph nodes and its ranks.
+    #With sparse=True the ranks are found by power iteration on the sparse adjacency matrix, the teleport
+    #term is applied to the vector instead of being added to every cell, so memory stays O(edges).
+    #tol, max_iter and start (previous ranks, as a dict of node -> rank or an array in graph.nodes() order)
+    #are only used by the sparse mode.
+    vec = pagerank_weighted_vector(graph, damping, sparse, tol, max_iter, start)
+    return process_results(graph, vec)
+
+
+def pagerank_weighted_vector(graph, damping=0.85, sparse=False, tol=PAGERANK_TOL, max_iter=PAGERANK_MAX_ITER,
+                             start=None):
+    #Get the ranks of the graph nodes as an array, in graph.nodes() order.
+    if len(graph) and not graph.degrees().any():
+        return uniform_vector(len(graph))
+    if sparse:
+        start = _start_vector(graph, start)
+        if isinstance(graph, ArrayGraph):
+            # the transpose is the CSC matrix of the CSR arrays, no transposed copy is needed
+            transposed = _normalized_transpose(graph.adjacency, damping)
+        else:
+            transposed = build_adjacency_matrix(graph, coeff=damping).T.tocsr()
+        return numpy.abs(_power_iteration(transposed, damping, tol, max_iter, start))
+
     coeff_adjacency_matrix = build_adjacency_matrix(graph, coeff=damping)
     probabilities = (1 - damping) / float(len(graph))
     pagerank_matrix = coeff_adjacency_matrix.toarray()
@@ -17,11 +44,83 @@ def pagerank_weighted(graph, damping=0.85):
     pagerank_matrix += probabilities
     vec = principal_eigenvector(pagerank_matrix.T)
     # Because pagerank_matrix is positive, vec is always real (i.e. not complex)
-    return process_results(graph, vec.real)
+    return numpy.abs(vec.real)
+
+
+def pagerank_weighted_batch(graphs, damping=0.85, tol=PAGERANK_TOL, max_iter=PAGERANK_MAX_ITER):
+    #Get the pagerank_weighted_vector(graph, damping, sparse=True) of every graph with one power iteration:
+    #the adjacency matrices are the blocks of one block diagonal matrix, teleport and normalization are
+    #applied per block and every block stops moving once its own error is below tol.
+    graphs = list(graphs)
+    sizes = numpy.array([len(graph) for graph in graphs], dtype=numpy.int64)
+    if len(graphs) == 0 or sizes.sum() == 0:
+        return [numpy.empty(0) for graph in graphs]
+    ranked = [i for i, graph in enumerate(graphs) if len(graph) and graph.degrees().any()]
+    vectors = [uniform_vector(size) if size else numpy.empty(0) for size in sizes.tolist()]
+    if not ranked:
+        return vectors
+
+    ranked_sizes = sizes[ranked]
+    # stacked before normalization, the rows of all graphs are then normalized and transposed at once
+    adjacency = _block_diagonal([_adjacency_matrix(graphs[i]) for i in ranked])
+    transposed = _normalize_adjacency_matrix(adjacency, damping).T.tocsr()
+    n_blocks = len(ranked)
+    blocks = numpy.repeat(numpy.arange(n_blocks), ranked_sizes)
+    teleport = ((1 - damping) / ranked_sizes.astype(numpy.float64))[blocks]
+    vec = 1.0 / ranked_sizes[blocks].astype(numpy.float64)
+    active = numpy.ones(n_blocks, dtype=bool)
+    error = numpy.full(n_blocks, numpy.inf)
+    for iteration in range(max_iter):
+        new_vec = transposed.dot(vec) + teleport * numpy.bincount(blocks, vec, n_blocks)[blocks]
+        new_vec /= numpy.bincount(blocks, new_vec, n_blocks)[blocks]
+        error = numpy.where(active, numpy.bincount(blocks, numpy.abs(new_vec - vec), n_blocks), error)
+        # converged blocks keep the vector of the iteration they converged on
+        vec = numpy.where(active[blocks], new_vec, vec)
+        active &= error >= tol
+        if not active.any():
+            break
+    else:
+        logger.warning("Pagerank did not converge in %d iterations for %d of %d graphs (error %g)",
+                       max_iter, active.sum(), n_blocks, error.max())
+
+    norms = numpy.sqrt(numpy.bincount(blocks, vec * vec, n_blocks))
+    vec /= norms[blocks]
+    for i, block in zip(ranked, numpy.split(vec, numpy.cumsum(ranked_sizes)[:-1])):
+        vectors[i] = block
+    return vectors
+
+
+def _adjacency_matrix(graph):
+    if isinstance(graph, ArrayGraph):
+        return graph.adjacency
+    return build_adjacency_matrix(graph)
+
+
+def _block_diagonal(matrices):
+    # scipy.sparse.block_diag builds a matrix per block, the CSR arrays are concatenated instead
+    sizes = numpy.array([matrix.shape[0] for matrix in matrices], dtype=numpy.int64)
+    nnz = numpy.array([matrix.nnz for matrix in matrices], dtype=numpy.int64)
+    node_offsets = numpy.cumsum(sizes) - sizes
+    nnz_offsets = numpy.cumsum(nnz) - nnz
+    indptr = numpy.concatenate(
+        [[0]] + [matrix.indptr[1:] + offset for matrix, offset in zip(matrices, nnz_offsets.tolist())])
+    indices = numpy.concatenate(
+        [matrix.indices.astype(numpy.int64) + offset for matrix, offset in zip(matrices, node_offsets.tolist())])
+    data = numpy.concatenate([matrix.data for matrix in matrices])
+    length = int(sizes.sum())
+    return csr_matrix((data, indices, indptr), shape=(length, length))
+
+
+def uniform_vector(length):
+    #Get the ranks of a graph of length nodes and no edge: the walk only teleports, so every node ranks the
+    #same, as in the complete graph. Unit norm, like the eigenvectors.
+    return numpy.full(length, 1.0 / numpy.sqrt(length))
 
 
 def build_adjacency_matrix(graph, coeff=1):
     #Get matrix representation of given graph.
+    if isinstance(graph, ArrayGraph):
+        return _normalize_adjacency_matrix(graph.adjacency, coeff)
     row = []
     col = []
     data = []
@@ -41,6 +140,24 @@ def build_adjacency_matrix(graph, coeff=1):
     return csr_matrix((data, (row, col)), shape=(length, length))
 
 
+def _normalize_adjacency_matrix(adjacency, coeff):
+    # every row is divided by the sum of its weights, rows without weights stay empty
+    sums = numpy.asarray(adjacency.sum(axis=1)).ravel()
+    scale = numpy.zeros(len(sums))
+    numpy.divide(coeff, sums, out=scale, where=sums != 0)
+    return csr_matrix(diags(scale).dot(adjacency))
+
+
+def _normalized_transpose(adjacency, coeff):
+    # the transpose of _normalize_adjacency_matrix, for any adjacency: the CSR arrays with the data of every
+    # row scaled are the CSC arrays of the transpose
+    sums = numpy.asarray(adjacency.sum(axis=1)).ravel()
+    scale = numpy.zeros(len(sums))
+    numpy.divide(coeff, sums, out=scale, where=sums != 0)
+    data = adjacency.data * numpy.repeat(scale, numpy.diff(adjacency.indptr))
+    return csc_matrix((data, adjacency.indices, adjacency.indptr), shape=adjacency.shape[::-1])
+
+
 def build_probability_matrix(graph, coeff=1.0):
     #Get square matrix of shape nxn, where n is number of nodes of the given graph.
     dimension = len(graph)
@@ -54,6 +171,9 @@ def principal_eigenvector(a):
     #Get eigenvector of square matrix a.
     # Note that we prefer to use eigs even for dense matrix
     # because we need only one eigenvector.
+    # The solvers are only imported here, the sparse power iteration does not need them.
+    from scipy.linalg import eig
+    from scipy.sparse.linalg import eigs
     if len(a) < 3: #works only for dim A < 3
         vals, vecs = eig(a)
         ind = numpy.abs(vals).argmax()
@@ -63,6 +183,42 @@ def principal_eigenvector(a):
         return vecs[:, 0]
 
 
+def _power_iteration(transposed, damping, tol, max_iter, start):
+    length = transposed.shape[0]
+    teleport = (1 - damping) / float(length)
+    vec = numpy.full(length, 1.0 / length) if start is None else start / start.sum()
+    error = numpy.inf
+    for iteration in range(max_iter):
+        # the teleport matrix times vec is the same value in every cell
+        new_vec = transposed.dot(vec) + teleport * vec.sum()
+        new_vec /= new_vec.sum()
+        error = numpy.abs(new_vec - vec).sum()
+        vec = new_vec
+        if error < tol:
+            break
+    else:
+        logger.warning("Pagerank did not converge in %d iterations (error %g)", max_iter, error)
+    # same scale as the unit eigenvector of the dense path
+    return vec / numpy.linalg.norm(vec)
+
+
+def _start_vector(graph, start):
+    if start is None:
+        return None
+    if isinstance(start, dict):
+        values = [start.get(node) for node in graph.nodes()]
+        known = [value for value in values if value is not None]
+        # new nodes start from the average rank of the known ones
+        default = sum(known) / len(known) if known else 1.0
+        start = [default if value is None else value for value in values]
+    start = numpy.abs(numpy.asarray(start, dtype=numpy.float64))
+    if start.shape != (len(graph),):
+        raise ValueError("Start vector has %d values for %d nodes" % (start.size, len(graph)))
+    if start.sum() == 0:
+        return None
+    return start
+
+
 def process_results(graph, vec):
     #Get graph nodes and corresponding absolute values of provided eigenvector.
     scores = {}
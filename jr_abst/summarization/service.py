@@ -0,0 +1,214 @@
+#service
+#Asyncio front end of summarize. Summaries are computed in a bounded executor, processes by default, so the
+#event loop never blocks on them. At most max_pending distinct requests are in flight, queued or running,
+#the ones above are rejected with ServiceOverloaded. Requests for the same text and parameters that arrive
+#while one is in flight share its result. serve_jsonl answers JSON lines read from a stream, main runs it on
+#the standard streams:
+#    python -m jr_abst.summarization.service --workers 4 < requests.jsonl > summaries.jsonl
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from jr_abst.summarization.cache import make_key as _make_cache_key
+from jr_abst.summarization.summarizer import summarize as _summarize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 64
+#fields of a JSON line request passed on to summarize
+REQUEST_OPTIONS = ('ratio', 'word_count', 'split', 'sparse', 'top_k', 'approximate', 'hash_bits')
+
+
+class ServiceOverloaded(RuntimeError):
+    pass
+
+
+class SummarizationService(object):
+    #executor is 'process', 'thread' or an Executor, which is then not shut down by close(). timeout, in
+    #seconds, is the default of every request, a request that times out still completes in the executor and
+    #its result is kept for the requests coalesced with it. With a SummaryCache, summaries are looked up
+    #before and stored after the executor. When a worker process dies, the requests it breaks fail with
+    #BrokenProcessPool and a process executor of the service is replaced by a new one for the next requests.
+    def __init__(self, max_workers=None, executor='process', max_pending=DEFAULT_MAX_PENDING, timeout=None,
+                 cache=None):
+        self._max_workers = max_workers
+        self._process = executor == 'process'
+        if executor == 'process':
+            self._executor = ProcessPoolExecutor(max_workers)
+        elif executor == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers)
+        else:
+            self._executor = executor
+        self._own_executor = isinstance(executor, str)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.cache = cache
+        self._in_flight = {}
+        self.requests = 0
+        self.computed = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def __len__(self):
+        #Number of distinct summaries in flight.
+        return len(self._in_flight)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self, wait=True):
+        if self._own_executor:
+            self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        return {'requests': self.requests, 'computed': self.computed, 'coalesced': self.coalesced,
+                'rejected': self.rejected, 'timeouts': self.timeouts, 'restarts': self.restarts,
+                'in_flight': len(self._in_flight)}
+
+    def _restart(self, executor):
+        # the broken executor is replaced once, by the first of its requests that finds it broken
+        if not (self._own_executor and self._process) or executor is not self._executor:
+            return
+        logger.warning("A summarization worker died, restarting the process pool")
+        executor.shutdown(wait=False)
+        self._executor = ProcessPoolExecutor(self._max_workers)
+        self.restarts += 1
+
+    def _submit(self, job):
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            future = loop.run_in_executor(executor, job)
+        except BrokenProcessPool:
+            # broken by an earlier request, this one never ran and goes to the new executor
+            self._restart(executor)
+            executor = self._executor
+            future = loop.run_in_executor(executor, job)
+        return future, executor
+
+    async def summarize(self, text, ratio=0.2, word_count=None, split=False, timeout=None, **options):
+        #Returns summarize(text, ratio, word_count, split, **options), options being sparse, top_k,
+        #approximate or hash_bits. Raises ServiceOverloaded when max_pending summaries are in flight and
+        #asyncio.TimeoutError after timeout seconds, the default timeout of the service when None.
+        self.requests += 1
+        key = _make_cache_key(text, ratio, word_count, split, **options)
+        if self.cache is not None:
+            summary = self.cache.get(key)
+            if summary is not None:
+                return summary
+
+        future = self._in_flight.get(key)
+        if future is None:
+            if len(self._in_flight) >= self.max_pending:
+                self.rejected += 1
+                raise ServiceOverloaded("%d summaries are already in flight" % len(self._in_flight))
+            job = partial(_summarize, text, ratio=ratio, word_count=word_count, split=split, **options)
+            future, executor = self._submit(job)
+            self._in_flight[key] = future
+            future.add_done_callback(partial(self._done, key, executor))
+            self.computed += 1
+        else:
+            self.coalesced += 1
+
+        try:
+            # shielded, a caller that times out or is cancelled does not cancel the others
+            summary = await asyncio.wait_for(asyncio.shield(future), self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        # coalesced callers share the result, each gets its own list
+        return list(summary) if isinstance(summary, list) else summary
+
+    def _done(self, key, executor, future):
+        del self._in_flight[key]
+        if future.cancelled():
+            return
+        # retrieved here, so that an error nobody waits for any more is not reported as never retrieved
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._restart(executor)
+        elif error is None and self.cache is not None:
+            self.cache.put(key, future.result())
+
+
+async def _answer(service, line, output, slots):
+    started = time.perf_counter()
+    response = {}
+    try:
+        request = json.loads(line)
+        response['id'] = request.get('id')
+        unknown = set(request) - set(REQUEST_OPTIONS) - {'id', 'text'}
+        if unknown:
+            raise ValueError("Unknown request fields: %s" % ", ".join(sorted(unknown)))
+        options = dict((name, request[name]) for name in REQUEST_OPTIONS if name in request)
+        response['summary'] = await service.summarize(request['text'], **options)
+    except Exception as error:
+        response['error'] = str(error) or type(error).__name__
+        response['error_type'] = type(error).__name__
+    finally:
+        slots.release()
+    response['seconds'] = time.perf_counter() - started
+    output.write(json.dumps(response) + '\n')
+    output.flush()
+
+
+async def serve_jsonl(service, input=None, output=None, max_concurrency=None):
+    #Answers every JSON line of input, an object with a text, an optional id and the fields of REQUEST_OPTIONS,
+    #with a JSON line {"id", "summary" or "error" and "error_type", "seconds"} on output, in completion order.
+    #At most max_concurrency requests (default the max_pending of the service) are read ahead of the answers,
+    #so a fast producer waits instead of being rejected.
+    input = sys.stdin if input is None else input
+    output = sys.stdout if output is None else output
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max_concurrency or service.max_pending)
+    tasks = set()
+    while True:
+        await slots.acquire()
+        line = await loop.run_in_executor(None, input.readline)
+        if not line:
+            break
+        if not line.strip():
+            slots.release()
+            continue
+        task = loop.create_task(_answer(service, line, output, slots))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarizes the JSON line requests of standard input")
+    parser.add_argument('--workers', type=int, default=None, help="executor workers, default the number of CPUs")
+    parser.add_argument('--threads', action='store_true', help="summarize in threads instead of processes")
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                        help="distinct summaries in flight")
+    parser.add_argument('--timeout', type=float, default=None, help="seconds before a request fails")
+    args = parser.parse_args(argv)
+
+    service = SummarizationService(args.workers, 'thread' if args.threads else 'process', args.max_pending,
+                                   args.timeout)
+    started = time.perf_counter()
+    try:
+        asyncio.run(serve_jsonl(service))
+    finally:
+        service.close()
+    stats = service.stats()
+    stats['seconds'] = time.perf_counter() - started
+    sys.stderr.write(json.dumps(stats) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+#streaming
+#Summaries of texts too long for one graph. Sentences are read from an iterable of chunks, ranked by windows
+#of consecutive sentences, and only the best of every window are kept as candidates. The candidates are
+#trimmed to the best ones whenever they get too many. A second pass ranks them, again by windows, and selects
+#the summary among them, so no graph has more than window nodes.
+#LiveSummarizer keeps the summary of a text that grows, e.g. a live transcript, up to date.
+import logging
+from array import array
+from collections import Counter
+import numpy
+from scipy.sparse import csr_matrix
+from jr_abst.summarization.textcleaner import iter_stream_sentences as _iter_stream_sentences
+from jr_abst.summarization.textcleaner import get_default_preprocessor as _get_default_preprocessor
+from jr_abst.summarization.textcleaner import SentenceBuffer as _SentenceBuffer
+from jr_abst.summarization.syntactic_unit import SyntacticUnit as _SyntacticUnit
+from jr_abst.summarization.bm25 import IncrementalBM25 as _IncrementalBM25
+from jr_abst.summarization.bm25 import PARAM_K1, PARAM_B
+from jr_abst.summarization.graph import ArrayGraph as _ArrayGraph
+from jr_abst.summarization.pagerank_weighted import pagerank_weighted_vector as _pagerank_vector
+from jr_abst.summarization.summarizer import rank_sentences as _rank_sentences
+from jr_abst.summarization.summarizer import _get_sentences_with_word_count, _ranking, _empty_ranking
+from jr_abst.summarization.summarizer import _summary_from_ranking
+from jr_abst.summarization.summarizer import INPUT_MIN_LENGTH, WEIGHT_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+#sentences ranked together, the graphs have at most this many nodes
+STREAM_WINDOW = 2000
+#share of every window kept as candidates, in times the ratio of the summary
+CANDIDATE_FACTOR = 2
+
+
+class _Candidate(object):
+    __slots__ = ('index', 'text', 'tokens', 'score')
+
+    def __init__(self, index, text, tokens):
+        self.index = index
+        self.text = text
+        self.tokens = tokens
+        self.score = -1
+
+
+def _build_window_corpus(candidates):
+    # bag of words of every candidate, with ids of a vocabulary local to the window
+    vocabulary = {}
+    corpus = []
+    for candidate in candidates:
+        ids = [vocabulary.setdefault(token, len(vocabulary)) for token in candidate.tokens]
+        corpus.append(sorted(Counter(ids).items()))
+    return corpus
+
+
+def _rank_window(candidates, **options):
+    #Sets the score of every candidate to its rank in the window relative to the average rank of the window,
+    #so that candidates of different windows compare. Returns the candidates, best first.
+    indices, scores = _rank_sentences(_build_window_corpus(candidates), **options)
+    if len(indices) == 0:
+        # the window could not be ranked, its sentences score as unreachable ones
+        for candidate in candidates:
+            candidate.score = 0.0
+        return list(candidates)
+    mean = scores.mean()
+    relative = scores / mean if mean > 0 else numpy.ones(len(scores))
+    ranked = []
+    for index, score in zip(indices.tolist(), relative.tolist()):
+        candidates[index].score = score
+        ranked.append(candidates[index])
+    return ranked
+
+
+def _select_candidates(candidates, window, ratio, count, word_count, options):
+    # candidates are ranked by windows and compared on their relative scores
+    ranked = []
+    for start in range(0, len(candidates), window):
+        ranked.extend(_rank_window(candidates[start:start + window], **options))
+    if not any(candidate.score > 0 for candidate in ranked):
+        return []
+    ranked.sort(key=lambda candidate: -candidate.score)
+    if word_count is not None:
+        return _get_sentences_with_word_count(ranked, word_count)
+    return ranked[:int(count * ratio)]
+
+
+def _trim_candidates(kept, limit):
+    # the best limit candidates on the scores of their first pass, back in text order
+    kept.sort(key=lambda candidate: -candidate.score)
+    del kept[limit:]
+    kept.sort(key=lambda candidate: candidate.index)
+
+
+def summarize_stream(chunks, ratio=0.2, word_count=None, split=False, window=STREAM_WINDOW, candidates=None,
+                     sparse=True, top_k=None, approximate=False):
+    #Summarizes the text made of chunks, an iterable of strings or a file object opened in text mode, and
+    #returns the summary as summarize does, sentences in their order in the text. Every window sentences,
+    #the best candidates share of them (default CANDIDATE_FACTOR times ratio) is kept, the summary is then
+    #selected among the candidates. A text that fits in one window is ranked once, as summarize would.
+    #Memory does not grow with the length of the text beyond the summary: window sentences are pending and,
+    #when they get twice as many as the larger of window and the sentences of the summary so far, the
+    #candidates are trimmed to the best of them. With word_count, the candidates are at most 2 * window.
+    if window < INPUT_MIN_LENGTH:
+        raise ValueError("Window must have at least %d sentences" % INPUT_MIN_LENGTH)
+    if candidates is None:
+        candidates = min(1.0, CANDIDATE_FACTOR * ratio)
+    options = dict(sparse=sparse, top_k=top_k, approximate=approximate)
+    preprocessor = _get_default_preprocessor()
+
+    kept = []
+    pending = []
+    count = 0
+    reduced = False
+    for index, sentence in enumerate(_iter_stream_sentences(chunks)):
+        tokens = preprocessor.preprocess(sentence)
+        if not tokens:
+            continue
+        if len(pending) == window:
+            logger.info('Ranking window of %d sentences ending at sentence %d', window, index)
+            kept.extend(_rank_window(pending, **options)[:max(1, int(window * candidates))])
+            pending = []
+            reduced = True
+            limit = window if word_count is not None else max(window, int(count * ratio))
+            if len(kept) >= 2 * limit:
+                _trim_candidates(kept, limit)
+        pending.append(_Candidate(index, sentence, tokens))
+        count += 1
+
+    if count == 0:
+        logger.warning("Input text is empty.")
+        return [] if split else u""
+    if count == 1:
+        raise ValueError("Input must have more than one sentence")
+    if count < INPUT_MIN_LENGTH:
+        logger.warning("Input text is expected to have at least %d sentences.", INPUT_MIN_LENGTH)
+
+    if reduced:
+        kept.extend(_rank_window(pending, **options)[:max(1, int(len(pending) * candidates))])
+        logger.info('Selecting summary of %d sentences among %d candidates', count, len(kept))
+    else:
+        kept = pending
+    selected = _select_candidates(kept, window, ratio, count, word_count, options)
+
+    if not selected:
+        logger.warning("Couldn't get relevant sentences.")
+        return [] if split else u""
+
+    # Sorts the selected sentences by apparition order in the original text.
+    selected.sort(key=lambda candidate: candidate.index)
+    if split:
+        return [candidate.text for candidate in selected]
+    return "\n".join(candidate.text for candidate in selected)
+
+
+class LiveSummarizer(object):
+    #Summary of a text that grows by appended chunks or sentences. The sentences are split and preprocessed
+    #once, the BM25 statistics are updated with the new ones and only the edges of the new sentences are
+    #scored, against the sentences that share a word with them, all of them at once from the postings of
+    #its words. The edges between older sentences keep the weights they got with the statistics of their
+    #time, rebuild() scores all of them again. Pagerank starts from the previous ranks, so a small update
+    #converges in a few iterations.
+    def __init__(self, preprocessor=None):
+        self.preprocessor = _get_default_preprocessor() if preprocessor is None else preprocessor
+        self.sentences = []
+        self.corpus = []
+        self.vocabulary = {}
+        self.bm25 = _IncrementalBM25()
+        self.postings = {}  # word -> indices of the sentences with word, an array('q')
+        self._lengths = array('d')  # words of every sentence
+        self._buffer = _SentenceBuffer()
+        self._count = 0  # sentences read, with the ones without tokens
+        self._first = array('q')
+        self._second = array('q')
+        self._weights = array('d')
+        self._adjacency = csr_matrix((0, 0))
+        self._assembled = 0  # edges already in _adjacency
+        self._scores = numpy.empty(0)
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def add_text(self, text):
+        #Appends text, the last sentence is only added once the text that follows shows it is complete.
+        #Returns the number of sentences added.
+        return self.add_sentences(self._buffer.feed(text))
+
+    def flush(self):
+        #Adds the sentence held back by add_text.
+        return self.add_sentences(self._buffer.close())
+
+    def add_sentences(self, sentences):
+        #Appends already split sentences, returns the number of them that kept tokens.
+        start = len(self.sentences)
+        for sentence in sentences:
+            tokens = self.preprocessor.preprocess(sentence)
+            self._count += 1
+            if not tokens:
+                continue
+            ids = [self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens]
+            self.sentences.append(_SyntacticUnit(sentence, " ".join(tokens), index=self._count - 1))
+            self.corpus.append(sorted(Counter(ids).items()))
+            self._lengths.append(len(self.corpus[-1]))
+        self.bm25.add_documents(self.corpus[start:])
+        for j in range(start, len(self.corpus)):
+            self._add_edges(j)
+        return len(self.sentences) - start
+
+    def _add_edges(self, j):
+        # edges of sentence j to the sentences before it that share a word, then j joins the postings. The
+        # words are the (id, count) pairs of the corpus, each one is once in its sentence, so the BM25 score
+        # one sentence gives another is the sum of the idf of their shared words times the length factor of
+        # the scored one
+        bm25 = self.bm25
+        if bm25._stale:
+            bm25.update()
+        document = self.corpus[j]
+        shared = [(bm25.idf[word], numpy.array(self.postings[word], dtype=numpy.int64))
+                  for word in document if word in self.postings]
+        for word in document:
+            self.postings.setdefault(word, array('q')).append(j)
+        if not shared:
+            return
+        idf = numpy.repeat([value for value, _ in shared], [len(postings) for _, postings in shared])
+        first, position = numpy.unique(numpy.concatenate([postings for _, postings in shared]), return_inverse=True)
+        idf = numpy.bincount(position, weights=idf, minlength=len(first))
+
+        # the weight i gives j if it passes the threshold, else the one j gives i, as ArrayGraph.from_matrix
+        factor = PARAM_K1 + 1
+        lengths = numpy.frombuffer(self._lengths, dtype=numpy.float64)
+        given = idf * factor / (1 + PARAM_K1 * (1 - PARAM_B + PARAM_B * lengths[j] / bm25.avgdl))
+        received = idf * factor / (1 + PARAM_K1 * (1 - PARAM_B + PARAM_B * lengths[first] / bm25.avgdl))
+        del lengths
+        weights = numpy.where(given >= WEIGHT_THRESHOLD, given, received)
+        kept = weights >= WEIGHT_THRESHOLD
+        self._first.extend(first[kept].tolist())
+        self._second.extend([j] * int(kept.sum()))
+        self._weights.extend(weights[kept].tolist())
+
+    def rebuild(self):
+        #Scores the edges of all sentences again with the current statistics.
+        self.postings = {}
+        self._first, self._second, self._weights = array('q'), array('q'), array('d')
+        self._adjacency = csr_matrix((0, 0))
+        self._assembled = 0
+        for j in range(len(self.corpus)):
+            self._add_edges(j)
+
+    def _graph(self):
+        # the adjacency of the last ranking grows by the rows of the new sentences and their new edges
+        length = len(self.corpus)
+        new = slice(self._assembled, len(self._weights))
+        first = numpy.array(self._first[new], dtype=numpy.int64)
+        second = numpy.array(self._second[new], dtype=numpy.int64)
+        weights = numpy.array(self._weights[new], dtype=numpy.float64)
+        added = csr_matrix(
+            (numpy.concatenate((weights, weights)),
+             (numpy.concatenate((first, second)), numpy.concatenate((second, first)))),
+            shape=(length, length))
+        adjacency = self._adjacency
+        indptr = numpy.concatenate(
+            (adjacency.indptr, numpy.full(length - adjacency.shape[0], adjacency.indptr[-1])))
+        adjacency = csr_matrix((adjacency.data, adjacency.indices, indptr), shape=(length, length))
+        self._adjacency = adjacency + added
+        self._assembled = len(self._weights)
+        return _ArrayGraph(range(length), self._adjacency)
+
+    def rank(self):
+        #Returns the indices of the sentences by decreasing pagerank score and their scores, as rank_sentences.
+        length = len(self.corpus)
+        if length == 0:
+            logger.warning("Input corpus is empty.")
+            return _empty_ranking()
+        graph = self._graph()
+        if graph.degrees().any():
+            graph.del_isolated_nodes()
+        if len(graph) < 3:
+            logger.warning("Please add more sentences to the text. The number of reachable nodes is below 3")
+            return _empty_ranking()
+
+        # the previous ranks, new and unranked sentences start from their average
+        nodes = numpy.asarray(graph.nodes(), dtype=numpy.int64)
+        start = numpy.zeros(length)
+        start[:len(self._scores)] = self._scores
+        start = start[nodes]
+        known = start > 0
+        start[~known] = start[known].mean() if known.any() else 1.0
+
+        vector = _pagerank_vector(graph, sparse=True, start=start)
+        self._scores = numpy.zeros(length)
+        self._scores[nodes] = vector
+        return _ranking(length, graph, vector)
+
+    def summary(self, ratio=0.2, word_count=None, split=False):
+        #Returns the summary of the sentences added so far, as summarize does.
+        if not self.sentences:
+            return [] if split else u""
+        if len(self.sentences) == 1:
+            raise ValueError("Input must have more than one sentence")
+        return _summary_from_ranking(self.sentences, self.corpus, self.rank(), ratio, word_count, split)
@@ -1,13 +1,28 @@
 #Summarizer
 import logging
-from utils import deprecated
-from jr_abst.summarization.summarizer import summarize
-from jr_abst.summarization.pagerank_weighted import pagerank_weighted as _pagerank
+from jr_abst.summarization.pagerank_weighted import pagerank_weighted_vector as _pagerank_vector
+from jr_abst.summarization.pagerank_weighted import pagerank_weighted_batch as _pagerank_batch
 from jr_abst.summarization.textcleaner import clean_text_by_sentences as _clean_text_by_sentences
+from jr_abst.summarization.textcleaner import build_sentence_store as _build_sentence_store
+from jr_abst.summarization.syntactic_unit import SyntacticUnitStore as _SyntacticUnitStore
 from jr_abst.summarization.commons import build_graph as _build_graph
 from jr_abst.summarization.commons import remove_unreachable_nodes as _remove_unreachable_nodes
 from jr_abst.summarization.bm25 import iter_bm25_bow as _bm25_weights
-from gensim.corpora import Dictionary
+from jr_abst.summarization.bm25 import SparseBM25 as _SparseBM25
+from jr_abst.summarization.graph import ArrayGraph as _ArrayGraph
+from jr_abst.summarization.lsh import approximate_scores_matrix as _approximate_scores_matrix
+from jr_abst.summarization.lsh import top_k_scores_matrix as _top_k_scores_matrix
+from jr_abst.summarization.lsh import TOP_K
+from jr_abst.summarization.cache import make_key as _make_cache_key
+from jr_abst.summarization.metrics import stage as _stage
+from jr_abst.summarization.hashing import bow_matrix as _bow_matrix
+from jr_abst.summarization.hashing import hash_tokens as _hash_tokens
+from jr_abst.summarization.hashing import hashed_bow_matrix as _hashed_bow_matrix
+from jr_abst.summarization.utils import effective_n_jobs
+from collections import deque
+from itertools import islice
+import numpy
+from scipy.sparse import issparse as _issparse
 from math import log10 as _log10
 from six.moves import range
 
@@ -17,35 +32,39 @@ WEIGHT_THRESHOLD = 1.e-3
 logger = logging.getLogger(__name__)
 
 
-def _set_graph_edge_weights(graph):
-    documents = graph.nodes()
-    weights = _bm25_weights(documents)
+def _set_graph_edge_weights(graph, weights):
+    # weights[i] are the BM25 scores of node i of graph against the other nodes, as (index, score) pairs
+    nodes = graph.nodes()
     for i, doc_bow in enumerate(weights):
         if i % 1000 == 0 and i > 0:
-            logger.info('PROGRESS: processing %s/%s doc (%s non zero elements)', i, len(documents), len(doc_bow))
+            logger.info('PROGRESS: processing %s/%s doc (%s non zero elements)', i, len(nodes), len(doc_bow))
         for j, weight in doc_bow:
             if i == j or weight < WEIGHT_THRESHOLD:
                 continue
-            edge = (documents[i], documents[j])
+            edge = (nodes[i], nodes[j])
             if not graph.has_edge(edge):
                 graph.add_edge(edge, weight)
 
-    # Handles the case in which all similarities are zero.
-    # The resultant summary will consist of random sentences.
-    if all(graph.edge_weight(edge) == 0 for edge in graph.iter_edges()):
-        _create_valid_graph(graph)
 
-
-def _create_valid_graph(graph):
-    nodes = graph.nodes()
-    for i in range(len(nodes)):
-        for j in range(len(nodes)):
-            if i == j:
-                continue
-            edge = (nodes[i], nodes[j])
-            if graph.has_edge(edge):
-                graph.del_edge(edge)
-            graph.add_edge(edge, 1)
+def _build_array_graph(corpus, top_k=None, approximate=False, metrics=None, background_idf=None,
+                       background_weight=1.0):
+    # Node i is document i of corpus.
+    with _stage(metrics, 'bm25') as stage:
+        if _issparse(corpus):
+            bm25 = _SparseBM25.from_bow_matrix(corpus, background_idf, background_weight)
+        else:
+            bm25 = _SparseBM25(corpus, background_idf, background_weight)
+        if approximate:
+            # only the pairs found by LSH are scored
+            scores = _approximate_scores_matrix(bm25, k=top_k or TOP_K, threshold=WEIGHT_THRESHOLD)
+        elif top_k is not None:
+            scores = _top_k_scores_matrix(bm25, top_k, threshold=WEIGHT_THRESHOLD)
+        else:
+            scores = bm25.get_scores_matrix()
+        stage.nodes, stage.edges = _corpus_size(corpus), scores.nnz
+    with _stage(metrics, 'graph') as stage:
+        stage.graph = graph = _ArrayGraph.from_matrix(scores, threshold=WEIGHT_THRESHOLD)
+    return graph
 
 
 def _get_doc_length(doc):
@@ -61,15 +80,47 @@ def _get_similarity(doc1, doc2, vec1, vec2):
 
 
 def _build_corpus(sentences):
+    # the store already has consistent token ids
+    if isinstance(sentences, _SyntacticUnitStore):
+        return [sentences.bow(i) for i in range(len(sentences))]
+    from gensim.corpora import Dictionary
     split_tokens = [sentence.token.split() for sentence in sentences]
     dictionary = Dictionary(split_tokens)
     return [dictionary.doc2bow(token) for token in split_tokens]
 
 
-def _get_important_sentences(sentences, corpus, important_docs):
-    hashable_corpus = _build_hasheable_corpus(corpus)
-    sentences_by_corpus = dict(zip(hashable_corpus, sentences))
-    return [sentences_by_corpus[tuple(important_doc)] for important_doc in important_docs]
+def _build_hashed_corpus(sentences, bits):
+    # the corpus is the CSR matrix of the counts of the hashed ids, no vocabulary is built
+    if isinstance(sentences, _SyntacticUnitStore):
+        ids = _hash_tokens(sentences.vocabulary, bits)[sentences.token_ids]
+        return _bow_matrix(sentences.token_indptr, ids, bits)
+    return _hashed_bow_matrix([sentence.token.split() for sentence in sentences], bits)
+
+
+def _corpus_size(corpus):
+    # corpora are lists of bags of words or CSR matrices of counts
+    return corpus.shape[0] if _issparse(corpus) else len(corpus)
+
+
+def _matrix_bow(matrix):
+    # the doc2bow lists of the rows of a matrix of counts
+    return [list(zip(matrix.indices[start:end].tolist(), matrix.data[start:end].astype(int).tolist()))
+            for start, end in zip(matrix.indptr[:-1].tolist(), matrix.indptr[1:].tolist())]
+
+
+def _get_important_sentences(sentences, indices, scores):
+    # only the selected units are built when sentences is a store
+    important_sentences = []
+    for index, score in zip(indices.tolist(), scores.tolist()):
+        sentence = sentences[index]
+        sentence.score = score
+        important_sentences.append(sentence)
+    return important_sentences
+
+
+def _word_count_reached(word_count, length, words_in_sentence):
+    # Checks if the inclusion of the sentence gives a worse approximation to the word parameter.
+    return abs(word_count - length - words_in_sentence) > abs(word_count - length)
 
 
 def _get_sentences_with_word_count(sentences, word_count):
@@ -79,20 +130,35 @@ def _get_sentences_with_word_count(sentences, word_count):
     # Loops until the word count is reached.
     for sentence in sentences:
         words_in_sentence = len(sentence.text.split())
-
-        # Checks if the inclusion of the sentence gives a better approximation to the word parameter.
-        if abs(word_count - length - words_in_sentence) > abs(word_count - length):
+        if _word_count_reached(word_count, length, words_in_sentence):
             return selected_sentences
         selected_sentences.append(sentence)
         length += words_in_sentence
     return selected_sentences
 
 
-def _extract_important_sentences(sentences, corpus, important_docs, word_count):
-    important_sentences = _get_important_sentences(sentences, corpus, important_docs)
-    return important_sentences \
-        if word_count is None \
-        else _get_sentences_with_word_count(important_sentences, word_count)
+def _get_ranked_sentences_with_word_count(sentences, indices, scores, word_count):
+    # the ranked sentences are walked until the word count is reached, the words of a unit of a store are
+    # counted on its text and the unit is only built once it is selected
+    length = 0
+    selected_sentences = []
+    for index, score in zip(indices, scores):
+        index = int(index)
+        text = sentences.text(index) if isinstance(sentences, _SyntacticUnitStore) else sentences[index].text
+        words_in_sentence = len(text.split())
+        if _word_count_reached(word_count, length, words_in_sentence):
+            break
+        sentence = sentences[index]
+        sentence.score = float(score)
+        selected_sentences.append(sentence)
+        length += words_in_sentence
+    return selected_sentences
+
+
+def _extract_important_sentences(sentences, indices, scores, word_count):
+    if word_count is None:
+        return _get_important_sentences(sentences, indices, scores)
+    return _get_ranked_sentences_with_word_count(sentences, indices, scores, word_count)
 
 
 def _format_results(extracted_sentences, split):
@@ -101,51 +167,109 @@ def _format_results(extracted_sentences, split):
     return "\n".join(sentence.text for sentence in extracted_sentences)
 
 
-def _build_hasheable_corpus(corpus):
-    return [tuple(doc) for doc in corpus]
+def _empty_ranking():
+    return numpy.empty(0, dtype=numpy.int64), numpy.empty(0)
 
 
-def summarize_corpus(corpus, ratio=0.2):
-    hashable_corpus = _build_hasheable_corpus(corpus)
+def _build_ranking_graph(corpus, array_graph=False, top_k=None, approximate=False, metrics=None,
+                         background_idf=None, background_weight=1.0):
+    #Returns the pruned graph pagerank runs on, None when corpus can not be ranked.
+    length = _corpus_size(corpus)
 
     #The function ends, if the corpus is empty.
-    if len(corpus) == 0:
+    if length == 0:
         logger.warning("Input corpus is empty.")
-        return []
+        return None
 
-    if len(corpus) < INPUT_MIN_LENGTH:
+    if length < INPUT_MIN_LENGTH:
         logger.warning("Input corpus is expected to have at least %d documents.", INPUT_MIN_LENGTH)
 
-    logger.info('Building graph')
-    graph = _build_graph(hashable_corpus)
-
-    logger.info('Filling graph')
-    _set_graph_edge_weights(graph)
-
-    logger.info('Removing unreachable nodes of graph')
-    _remove_unreachable_nodes(graph)
+    if array_graph:
+        logger.info('Building and filling array graph')
+        graph = _build_array_graph(corpus, top_k, approximate, metrics, background_idf, background_weight)
+    else:
+        if _issparse(corpus):
+            corpus = _matrix_bow(corpus)
+        with _stage(metrics, 'bm25') as stage:
+            weights = list(_bm25_weights(corpus, background_idf=background_idf,
+                                         background_weight=background_weight))
+            stage.nodes, stage.edges = length, sum(len(doc_bow) for doc_bow in weights)
+        with _stage(metrics, 'graph') as stage:
+            logger.info('Building graph')
+            graph = _build_graph(range(length))
+
+            logger.info('Filling graph')
+            _set_graph_edge_weights(graph, weights)
+            stage.graph = graph
+
+    # Handles the case in which all similarities are zero: no node is removed and pagerank gives all of them
+    # the same score, as it would on the complete graph. The resultant summary will consist of the first sentences.
+    with _stage(metrics, 'prune') as stage:
+        if graph.degrees().any():
+            logger.info('Removing unreachable nodes of graph')
+            _remove_unreachable_nodes(graph)
+        stage.graph = graph
 
     #Warns user to add more text.
-    if len(graph.nodes()) < 3:
+    if len(graph) < 3:
         logger.warning("Please add more sentences to the text. The number of reachable nodes is below 3")
-        return []
+        return None
+    return graph
 
-    logger.info('Pagerank graph')
-    pagerank_scores = _pagerank(graph)
 
-    logger.info('Sorting pagerank scores')
-    hashable_corpus.sort(key=lambda doc: pagerank_scores.get(doc, 0), reverse=True)
-
-    return [list(doc) for doc in hashable_corpus[:int(len(corpus) * ratio)]]
+def _ranking(length, graph, vector):
+    scores = numpy.zeros(length)
+    scores[numpy.asarray(graph.nodes(), dtype=numpy.int64)] = vector
 
-
-def summarize(text, ratio=0.2, word_count=None, split=False):
-    # Gets a list of processed sentences.
-    sentences = _clean_text_by_sentences(text)
+    logger.info('Sorting pagerank scores')
+    indices = numpy.argsort(-scores, kind='stable')
+    return indices, scores[indices]
+
+
+def rank_sentences(corpus, sparse=False, top_k=None, approximate=False, metrics=None, background_idf=None,
+                   background_weight=1.0):
+    #Returns the indices of the documents of corpus by decreasing pagerank score, ties in corpus order,
+    #and their scores. Every document is a node of its own, unreachable ones score 0.
+    #With top_k, every document only keeps edges to its top_k most similar documents. With approximate,
+    #only the pairs of documents that MinHash LSH finds similar are scored, and top_k defaults to TOP_K.
+    #Both build the array graph, whatever sparse is. metrics, a callable, receives the StageMetrics of
+    #every stage (see metrics.py). background_idf, a BackgroundIDF, and background_weight are given to BM25,
+    #the ids of corpus then have to be hashed ids of the table.
+    sparse = sparse or top_k is not None or approximate
+    graph = _build_ranking_graph(corpus, sparse, top_k, approximate, metrics, background_idf, background_weight)
+    if graph is None:
+        return _empty_ranking()
+
+    with _stage(metrics, 'pagerank') as stage:
+        logger.info('Pagerank graph')
+        ranking = _ranking(_corpus_size(corpus), graph, _pagerank_vector(graph, sparse=sparse))
+        stage.graph = graph
+    return ranking
+
+
+def rank_sentences_batch(corpora, sparse=False, top_k=None, approximate=False):
+    #Returns rank_sentences(corpus, sparse=True, ...) of every corpus of corpora. The graphs are built one by
+    #one, pagerank then runs once on all of them, which saves the setup of a solver per corpus when corpora
+    #are many short texts. sparse only selects the graph type, pagerank is always the sparse power iteration.
+    array_graph = sparse or top_k is not None or approximate
+    graphs = [_build_ranking_graph(corpus, array_graph, top_k, approximate) for corpus in corpora]
+
+    logger.info('Pagerank %d graphs', len(graphs))
+    vectors = iter(_pagerank_batch([graph for graph in graphs if graph is not None]))
+    return [_empty_ranking() if graph is None else _ranking(_corpus_size(corpus), graph, next(vectors))
+            for corpus, graph in zip(corpora, graphs)]
+
+
+def _build_summary_corpus(text, metrics=None, hash_bits=None):
+    # Gets the processed sentences, as columns, units are only built for the extracted ones. With hash_bits,
+    # the corpus is the matrix of the counts of the hashed token ids.
+    with _stage(metrics, 'cleaning') as stage:
+        sentences = _build_sentence_store(text)
+        stage.nodes = len(sentences)
 
     if len(sentences) == 0:
         logger.warning("Input text is empty.")
-        return [] if split else u""
+        return sentences, []
 
     if len(sentences) == 1:
         raise ValueError("Input must have more than one sentence")
@@ -153,19 +277,223 @@ def summarize(text, ratio=0.2, word_count=None, split=False):
     if len(sentences) < INPUT_MIN_LENGTH:
         logger.warning("Input text is expected to have at least %d sentences.", INPUT_MIN_LENGTH)
 
-    corpus = _build_corpus(sentences)
+    with _stage(metrics, 'corpus') as stage:
+        corpus = _build_corpus(sentences) if hash_bits is None else _build_hashed_corpus(sentences, hash_bits)
+        stage.nodes = _corpus_size(corpus)
+    return sentences, corpus
+
 
-    most_important_docs = summarize_corpus(corpus, ratio=ratio if word_count is None else 1)
+def _summary_from_ranking(sentences, corpus, ranking, ratio, word_count, split, metrics=None):
+    indices, scores = ranking
+    if word_count is None:
+        length = _corpus_size(corpus)
+        indices, scores = indices[:int(length * ratio)], scores[:int(length * ratio)]
 
     # If couldn't get important docs, the algorithm ends.
-    if not most_important_docs:
+    if len(indices) == 0:
         logger.warning("Couldn't get relevant sentences.")
         return [] if split else u""
 
-    # Extracts the most important sentences with the selected criterion.
-    extracted_sentences = _extract_important_sentences(sentences, corpus, most_important_docs, word_count)
-
-    # Sorts the extracted sentences by apparition order in the original text.
-    extracted_sentences.sort(key=lambda s: s.index)
+    with _stage(metrics, 'selection') as stage:
+        # Extracts the most important sentences with the selected criterion.
+        extracted_sentences = _extract_important_sentences(sentences, indices, scores, word_count)
+
+        # Sorts the extracted sentences by apparition order in the original text.
+        extracted_sentences.sort(key=lambda s: s.index)
+        stage.nodes = len(extracted_sentences)
+
+    return _format_results(extracted_sentences, split)
+
+
+def summarize_corpus(corpus, ratio=0.2, sparse=False, top_k=None, approximate=False, metrics=None,
+                     background_idf=None, background_weight=1.0):
+    #corpus may also be a CSR matrix of counts (see hashing.bow_matrix), the summary is then made of the
+    #doc2bow lists of its rows.
+    indices, scores = rank_sentences(corpus, sparse=sparse, top_k=top_k, approximate=approximate, metrics=metrics,
+                                     background_idf=background_idf, background_weight=background_weight)
+    if _issparse(corpus):
+        corpus = _matrix_bow(corpus)
+    return [list(corpus[index]) for index in indices[:int(len(corpus) * ratio)].tolist()]
+
+
+def summarize(text, ratio=0.2, word_count=None, split=False, sparse=False, cache=None, top_k=None,
+              approximate=False, metrics=None, hash_bits=None, background_idf=None, background_weight=1.0):
+    # With hash_bits, token ids are hashes of that many bits instead of the ids of a vocabulary of text. A
+    # BackgroundIDF needs hashed ids, hash_bits defaults to the bits of the table.
+    if background_idf is not None:
+        if hash_bits is not None and hash_bits != background_idf.bits:
+            raise ValueError("hash_bits %d do not match the %d bits of the background idf table"
+                             % (hash_bits, background_idf.bits))
+        hash_bits = background_idf.bits
+
+    # Summaries found in the cache are returned before any processing.
+    if cache is not None:
+        background = None if background_idf is None else (background_idf.fingerprint(), background_weight)
+        key = _make_cache_key(text, ratio, word_count, split, top_k=top_k, approximate=approximate,
+                              hash_bits=hash_bits, background=background)
+        summary = cache.get(key)
+        if summary is None:
+            summary = summarize(text, ratio=ratio, word_count=word_count, split=split, sparse=sparse,
+                                top_k=top_k, approximate=approximate, metrics=metrics, hash_bits=hash_bits,
+                                background_idf=background_idf, background_weight=background_weight)
+            cache.put(key, summary)
+        return summary
+
+    sentences, corpus = _build_summary_corpus(text, metrics, hash_bits)
+    if _corpus_size(corpus) == 0:
+        return [] if split else u""
 
-    return _format_results(extracted_sentences, split)
\ No newline at end of file
+    ranking = rank_sentences(corpus, sparse=sparse, top_k=top_k, approximate=approximate, metrics=metrics,
+                             background_idf=background_idf, background_weight=background_weight)
+    return _summary_from_ranking(sentences, corpus, ranking, ratio, word_count, split, metrics)
+
+
+def _summarize_chunk(args):
+    texts, kwargs = args
+    if kwargs.get('batch'):
+        return _summarize_batch(texts, **kwargs)
+    results = []
+    for text in texts:
+        try:
+            results.append(summarize(text, **kwargs))
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+def _summarize_batch(texts, ratio=0.2, word_count=None, split=False, sparse=False, top_k=None, approximate=False,
+                     hash_bits=None, batch=True):
+    # the sentences of all texts are ranked by one rank_sentences_batch, errors stay with their text
+    results = []
+    prepared = []
+    for text in texts:
+        try:
+            sentences, corpus = _build_summary_corpus(text, hash_bits=hash_bits)
+            results.append([] if split else u"")
+            if _corpus_size(corpus):
+                prepared.append((len(results) - 1, sentences, corpus))
+        except Exception as error:
+            results.append(error)
+
+    corpora = [corpus for _, _, corpus in prepared]
+    try:
+        rankings = rank_sentences_batch(corpora, sparse=sparse, top_k=top_k, approximate=approximate)
+    except Exception:
+        # a corpus failed, each one is ranked on its own so that the error stays with its text
+        rankings = []
+        for corpus in corpora:
+            try:
+                rankings.extend(rank_sentences_batch([corpus], sparse=sparse, top_k=top_k, approximate=approximate))
+            except Exception as error:
+                rankings.append(error)
+    for (position, sentences, corpus), ranking in zip(prepared, rankings):
+        if isinstance(ranking, Exception):
+            results[position] = ranking
+            continue
+        try:
+            results[position] = _summary_from_ranking(sentences, corpus, ranking, ratio, word_count, split)
+        except Exception as error:
+            results[position] = error
+    return results
+
+
+def _iter_chunks(iterable, chunksize):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _submit_chunk(executor, chunk, kwargs):
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+    try:
+        return executor.submit(_summarize_chunk, (chunk, kwargs))
+    except BrokenProcessPool as error:
+        # broken by an earlier chunk, this one fails like the chunks still in the executor
+        future = Future()
+        future.set_exception(error)
+        return future
+
+
+def _get_chunk_results(chunk, future):
+    from concurrent.futures.process import BrokenProcessPool
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        raise
+    except Exception as error:
+        # the chunk could not be sent back, e.g. an exception that does not pickle
+        return [error] * len(chunk)
+
+
+def _restart_executor(executor, n_processes):
+    from concurrent.futures import ProcessPoolExecutor
+    executor.shutdown(wait=False)
+    return ProcessPoolExecutor(n_processes)
+
+
+def _next_chunk_results(pending, executor, kwargs, n_processes):
+    #Returns the results of the first pending chunk and the executor of the next ones. A worker that died,
+    #e.g. killed by the system or crashed in native code, breaks the executor: it is replaced and the first
+    #chunk is retried alone, so that a chunk that kills its worker again yields the error for each of its
+    #texts instead of the ones sent with it. The chunks that did not finish are submitted again.
+    from concurrent.futures.process import BrokenProcessPool
+    chunk, future = pending.popleft()
+    try:
+        return _get_chunk_results(chunk, future), executor
+    except BrokenProcessPool:
+        pass
+    executor = _restart_executor(executor, n_processes)
+    try:
+        results = _get_chunk_results(chunk, _submit_chunk(executor, chunk, kwargs))
+    except BrokenProcessPool as error:
+        logger.warning("a worker died twice on a chunk of %d texts, they yield BrokenProcessPool", len(chunk))
+        executor = _restart_executor(executor, n_processes)
+        results = [error] * len(chunk)
+    for position, (other, other_future) in enumerate(pending):
+        if not other_future.done() or isinstance(other_future.exception(), BrokenProcessPool):
+            pending[position] = (other, _submit_chunk(executor, other, kwargs))
+    return results, executor
+
+
+def summarize_many(texts, ratio=0.2, word_count=None, split=False, sparse=False, n_jobs=1, chunksize=1,
+                   max_pending=None, top_k=None, approximate=False, batch=False, hash_bits=None):
+    #Yields the summary of every text, in input order. Chunks of chunksize texts are summarized in n_jobs
+    #worker processes, at most max_pending chunks (default two per process) are read ahead of the one
+    #being yielded, so memory does not depend on the length of texts. A text that fails yields its
+    #exception instead of a summary, the rest of the batch goes on. The texts of a chunk whose worker
+    #process dies twice yield BrokenProcessPool. With batch, the texts of a chunk are ranked together by
+    #rank_sentences_batch, use it with a large chunksize for many short texts.
+    kwargs = dict(ratio=ratio, word_count=word_count, split=split, sparse=sparse, top_k=top_k,
+                  approximate=approximate, hash_bits=hash_bits)
+    if batch:
+        kwargs['batch'] = True
+    n_processes = effective_n_jobs(n_jobs)
+    if n_processes == 1:
+        for chunk in _iter_chunks(texts, chunksize):
+            for summary in _summarize_chunk((chunk, kwargs)):
+                yield summary
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    if max_pending is None:
+        max_pending = 2 * n_processes
+    executor = ProcessPoolExecutor(n_processes)
+    try:
+        # the texts of a pending chunk are kept until its results are yielded, to submit it again if needed
+        pending = deque()
+        for chunk in _iter_chunks(texts, chunksize):
+            pending.append((chunk, _submit_chunk(executor, chunk, kwargs)))
+            if len(pending) >= max_pending:
+                results, executor = _next_chunk_results(pending, executor, kwargs, n_processes)
+                for summary in results:
+                    yield summary
+        while pending:
+            results, executor = _next_chunk_results(pending, executor, kwargs, n_processes)
+            for summary in results:
+                yield summary
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,14 +1,70 @@
 #syntactic_unit.py
+from collections import Counter
+import numpy
+
+
 class SyntacticUnit(object):
+    __slots__ = ('text', 'token', 'tag', 'index', 'score')
+
     def __init__(self, text, token=None, tag=None, index=-1):
         self.text = text
         self.token = token
         self.tag = tag[:2] if tag else None  # Just first two letters of tag
         self.index = index
         self.score = -1
-        
+
     def __str__(self):
         return "Original unit: '" + self.text + "' *-*-*-* " + "Processed unit: '" + self.token + "'"
 
     def __repr__(self):
-        return str(self)
\ No newline at end of file
+        return str(self)
+
+
+class SyntacticUnitStore(object):
+    #The units of one text as columns: offsets of their text in source, ids of their tokens in vocabulary
+    #(CSR style, the tokens of unit i are token_ids[token_indptr[i]:token_indptr[i + 1]]), their index,
+    #tag codes in tag_names (-1 for no tag) and scores. SyntacticUnit objects are only built when asked for.
+    def __init__(self, source, starts, ends, indexes, token_indptr, token_ids, vocabulary, tags=None, tag_names=()):
+        self.source = source
+        self.starts = numpy.asarray(starts, dtype=numpy.int64)
+        self.ends = numpy.asarray(ends, dtype=numpy.int64)
+        self.indexes = numpy.asarray(indexes, dtype=numpy.int64)
+        self.token_indptr = numpy.asarray(token_indptr, dtype=numpy.int64)
+        self.token_ids = numpy.asarray(token_ids, dtype=numpy.int32)
+        self.vocabulary = vocabulary
+        if tags is None:
+            tags = numpy.full(len(self.starts), -1)
+        self.tags = numpy.asarray(tags, dtype=numpy.int16)
+        self.tag_names = list(tag_names)
+        self.scores = numpy.full(len(self.starts), -1.0)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        #Returns unit i as a SyntacticUnit.
+        tag = self.tags[i]
+        unit = SyntacticUnit(self.text(i), self.token(i), self.tag_names[tag] if tag >= 0 else None,
+                             int(self.indexes[i]))
+        unit.score = self.scores[i]
+        return unit
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def units(self):
+        return list(self)
+
+    def text(self, i):
+        return self.source[self.starts[i]:self.ends[i]]
+
+    def token_ids_of(self, i):
+        return self.token_ids[self.token_indptr[i]:self.token_indptr[i + 1]]
+
+    def token(self, i):
+        return " ".join(self.vocabulary[token_id] for token_id in self.token_ids_of(i))
+
+    def bow(self, i):
+        #Returns the (token id, count) pairs of unit i, sorted by id, as Dictionary.doc2bow does.
+        return sorted(Counter(self.token_ids_of(i).tolist()).items())
@@ -1,15 +1,16 @@
 #textcleaner.py
-from gensim.parsing.preprocessing import preprocess_documents
-from jr_abst.summarization.syntactic_unit import SyntacticUnit
-from jr_abst.utils import tokenize, has_pattern
+from jr_abst.summarization.syntactic_unit import SyntacticUnit, SyntacticUnitStore
+from jr_abst.summarization.utils import tokenize, has_pattern
 from six.moves import range
+from array import array
+from functools import lru_cache
+import heapq
 import re
+import string
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
-HAS_PATTERN = has_pattern()
-if HAS_PATTERN:
-    from pattern.en import tag
 
 SEPARATOR = r'@'
 RE_SENTENCE = re.compile(r'(\S.+?[.!?])(?=\s+|$)|(\S.+?)(?=[\n]|$)', re.UNICODE)
@@ -18,10 +19,146 @@ AB_ACRONYM = re.compile(r'(\.[a-zA-Z]\.)\s(\w)', re.UNICODE)
 AB_ACRONYM_LETTERS = re.compile(r'([a-zA-Z])\.([a-zA-Z])\.', re.UNICODE)
 UNDO_AB_SENIOR = re.compile(r'([A-Z][a-z]{1,2}\.)' + SEPARATOR + r'(\w)', re.UNICODE)
 UNDO_AB_ACRONYM = re.compile(r'(\.[a-zA-Z]\.)' + SEPARATOR + r'(\w)', re.UNICODE)
+RE_NON_SPACE = re.compile(r'\S', re.UNICODE)
+RE_SENTENCE_END = re.compile(r'[.!?](?=\s|$)', re.UNICODE)
+RE_TAGS = re.compile(r"<([^>]+)>", re.UNICODE)
+#number of distinct words whose filtering and stemming is remembered
+STEM_CACHE_SIZE = 100000
 
 def split_sentences(text):
-    processed = replace_abbreviations(text)
-    return [undo_replacement(sentence) for sentence in get_sentences(processed)]
+    return [text[start:end] for start, end in iter_sentence_spans(text)]
+
+
+def get_sentence_spans(text):
+    return list(iter_sentence_spans(text))
+
+
+def iter_stream_sentences(chunks):
+    #Yields the sentences split_sentences finds in the concatenation of chunks, an iterable of strings
+    #or a file object opened in text mode.
+    sentences = SentenceBuffer()
+    for chunk in chunks:
+        for sentence in sentences.feed(chunk):
+            yield sentence
+    for sentence in sentences.close():
+        yield sentence
+
+
+class SentenceBuffer(object):
+    #Splits text that arrives in chunks. The last sentence of what was fed may go on in the next chunk,
+    #it is held back and split again with it, so only that sentence is kept in memory. Chunks that cannot
+    #end it are only appended, a long sentence is not split again for every chunk.
+    def __init__(self):
+        self._chunks = []
+        self._last = u""  # last character held back
+        self._ended = False  # the sentence held back ends before the text held back
+
+    @property
+    def buffer(self):
+        return u"".join(self._chunks)
+
+    def feed(self, chunk):
+        #Returns the sentences chunk completes.
+        if not chunk:
+            return []
+        if not self._may_end_sentence(chunk):
+            self._chunks.append(chunk)
+            self._last = chunk[-1]
+            return []
+        buffer = self.buffer + chunk
+        sentences = []
+        last = None
+        for start, end in iter_sentence_spans(buffer):
+            if last is not None:
+                sentences.append(buffer[last[0]:last[1]])
+            last = (start, end)
+        if last is not None:
+            self._ended = last[1] < len(buffer)
+            buffer = buffer[last[0]:]
+        else:
+            # a fragment too short to be a sentence, or only whitespace
+            self._ended = bool(buffer.strip())
+            buffer = buffer if self._ended else u""
+        self._chunks = [buffer] if buffer else []
+        self._last = buffer[-1:]
+        return sentences
+
+    def _may_end_sentence(self, chunk):
+        # a sentence that goes on to the end of what was fed only ends at a line end or a sentence end, text
+        # after a sentence that ended may start the next one
+        return self._ended or '\n' in chunk or RE_SENTENCE_END.search(self._last + chunk) is not None
+
+    def close(self):
+        #Returns the sentences held back, the buffer is emptied.
+        buffer = self.buffer
+        self._chunks = []
+        self._last = u""
+        self._ended = False
+        return split_sentences(buffer)
+
+
+def iter_sentence_spans(text):
+    #Yields the (start, end) offsets of the sentences of text, the sentences RE_SENTENCE finds once
+    #the abbreviations are replaced, in one scan and without copies of the text: the whitespace
+    #AB_SENIOR and AB_ACRONYM would replace is just not taken as a sentence or line end.
+    protected = _ProtectedSpaces(text)
+    length = len(text)
+    position = 0
+    line_end = -1
+    while True:
+        match = RE_NON_SPACE.search(text, position)
+        if match is None:
+            return
+        start = match.start()
+
+        # sentences never span lines, but a protected newline does not end one,
+        # the end of the line is only searched again once a sentence starts past it
+        if line_end <= start:
+            line_end = text.find('\n', start + 1)
+            while line_end != -1 and line_end in protected:
+                line_end = text.find('\n', line_end + 1)
+            if line_end == -1:
+                line_end = length
+
+        # a sentence is at least 3 characters up to [.!?] followed by a space that is not protected
+        end = None
+        search_start = start + 2
+        while True:
+            match = RE_SENTENCE_END.search(text, search_start, line_end)
+            if match is None:
+                break
+            if match.end() not in protected:
+                end = match.end()
+                break
+            search_start = match.end()
+
+        # else the sentence goes to the end of the line, one character lines are skipped
+        if end is None:
+            if line_end - start < 2:
+                position = start + 1
+                continue
+            end = line_end
+        yield start, end
+        position = end
+
+
+class _ProtectedSpaces(object):
+    #Positions of the whitespace the abbreviation regexes would replace, found lazily in order.
+    def __init__(self, text):
+        self._positions = heapq.merge(*[
+            (match.end(1) for match in regex.finditer(text)) for regex in (AB_SENIOR, AB_ACRONYM)])
+        self._found = set()
+        self._last = -1
+
+    def __contains__(self, position):
+        while self._last < position:
+            next_position = next(self._positions, None)
+            if next_position is None:
+                self._last = float('inf')
+                break
+            self._found.add(next_position)
+            self._last = next_position
+        return position in self._found
 
 
 def replace_abbreviations(text):
@@ -45,6 +182,86 @@ def get_sentences(text):
         yield match.group()
 
 
+class TextPreprocessor(object):
+    #Does what gensim's preprocess_string does with its default filters (lower case, strip tags,
+    #punctuation and digits, remove stopwords and words shorter than min_length, Porter stemming),
+    #with one translate over the text and one memoized call per word for the word filters and the
+    #stemmer. Each filter can be turned off and the stopwords replaced.
+    def __init__(self, stopwords=None, min_length=3, lowercase=True, strip_tags=True, strip_punctuation=True,
+                 strip_numeric=True, stem=True, cache_size=STEM_CACHE_SIZE):
+        if stopwords is None:
+            from gensim.parsing.preprocessing import STOPWORDS as stopwords
+        if stem:
+            from gensim.parsing.porter import PorterStemmer
+            self._stemmer = PorterStemmer
+        self.stopwords = frozenset(stopwords)
+        self.min_length = min_length
+        self.lowercase = lowercase
+        self.strip_tags = strip_tags
+        self.stem = stem
+        # punctuation becomes a space and digits are dropped, as strip_punctuation and strip_numeric do
+        self._translation = {}
+        if strip_punctuation:
+            self._translation.update((ord(char), u' ') for char in string.punctuation)
+        if strip_numeric:
+            self._translation.update((ord(char), None) for char in string.digits)
+        self._filter_word = lru_cache(maxsize=cache_size)(self._process_word)
+
+    def _process_word(self, word):
+        if word in self.stopwords or len(word) < self.min_length:
+            return None
+        # stemmers keep state while stemming, a new one per word keeps this thread safe
+        return self._stemmer().stem(word) if self.stem else word
+
+    def preprocess(self, text):
+        #Returns the list of tokens of text.
+        if self.lowercase:
+            text = text.lower()
+        if self.strip_tags and u'<' in text:
+            text = RE_TAGS.sub(u'', text)
+        if self._translation:
+            text = text.translate(self._translation)
+        tokens = []
+        for word in text.split():
+            token = self._filter_word(word)
+            if token is not None:
+                tokens.append(token)
+        return tokens
+
+    def preprocess_documents(self, documents):
+        return [self.preprocess(document) for document in documents]
+
+    def cache_info(self):
+        return self._filter_word.cache_info()
+
+
+_default_preprocessor = []
+_lazy_lock = threading.Lock()
+
+
+def get_default_preprocessor():
+    #Returns the TextPreprocessor used when none is given, built (and gensim imported) on first use.
+    with _lazy_lock:
+        if not _default_preprocessor:
+            _default_preprocessor.append(TextPreprocessor())
+    return _default_preprocessor[0]
+
+
+_tagger = []
+
+
+def get_tagger():
+    #Returns the tag function of pattern, or None when pattern is not installed. Checked on first use.
+    with _lazy_lock:
+        if not _tagger:
+            if has_pattern():
+                from pattern.en import tag
+                _tagger.append(tag)
+            else:
+                _tagger.append(None)
+    return _tagger[0]
+
+
 def merge_syntactic_units(original_units, filtered_units, tags=None):
     units = []
     for i in range(len(original_units)):
@@ -62,17 +279,36 @@ def join_words(words, separator=" "):
     return separator.join(words)
 
 
-def clean_text_by_sentences(text):
-    original_sentences = split_sentences(text)
-    filtered_sentences = [join_words(sentence) for sentence in preprocess_documents(original_sentences)]
-    return merge_syntactic_units(original_sentences, filtered_sentences)
+def clean_text_by_sentences(text, preprocessor=None):
+    return build_sentence_store(text, preprocessor).units()
+
+
+def build_sentence_store(text, preprocessor=None):
+    #Returns the SyntacticUnitStore of the sentences of text that keep at least one token.
+    preprocessor = get_default_preprocessor() if preprocessor is None else preprocessor
+    vocabulary = {}
+    starts, ends, indexes = array('q'), array('q'), array('q')
+    token_indptr, token_ids = array('q', [0]), array('l')
+    for index, (start, end) in enumerate(iter_sentence_spans(text)):
+        tokens = preprocessor.preprocess(text[start:end])
+        if not tokens:
+            continue
+        starts.append(start)
+        ends.append(end)
+        indexes.append(index)
+        for token in tokens:
+            token_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+        token_indptr.append(len(token_ids))
+    return SyntacticUnitStore(text, starts, ends, indexes, token_indptr, token_ids, list(vocabulary))
 
 
-def clean_text_by_word(text, deacc=True):
+def clean_text_by_word(text, deacc=True, preprocessor=None):
+    preprocessor = get_default_preprocessor() if preprocessor is None else preprocessor
     text_without_acronyms = replace_with_separator(text, "", [AB_ACRONYM_LETTERS])
     original_words = list(tokenize(text_without_acronyms, to_lower=True, deacc=deacc))
-    filtered_words = [join_words(word_list, "") for word_list in preprocess_documents(original_words)]
-    if HAS_PATTERN:
+    filtered_words = [join_words(word_list, "") for word_list in preprocessor.preprocess_documents(original_words)]
+    tag = get_tagger()
+    if tag is not None:
         tags = tag(join_words(original_words))  # tag needs the context of the words in the text
     else:
         tags = None
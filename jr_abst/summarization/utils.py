@@ -20,24 +20,18 @@ import random
 import itertools
 import tempfile
 from functools import wraps
-import multiprocessing
 import shutil
 import sys
-import subprocess
 import inspect
 import heapq
 
-import numpy as np
 import numbers
-import scipy.sparse
 
 from six import iterkeys, iteritems, itervalues, u, string_types, unichr
 from six.moves import range
 
 #from smart_open import open
 
-from multiprocessing import cpu_count
-
 if sys.version_info[0] >= 3:
     unicode = str
 
@@ -56,6 +50,60 @@ NO_CYTHON = RuntimeError(
 )
 """An exception that gensim code raises when Cython extensions are unavailable."""
 
+def to_unicode(text, encoding='utf8', errors='strict'):
+    """Convert `text` (bytestring in given encoding or unicode) to unicode.
+    Parameters
+    ----------
+    text : str
+        Input text.
+    errors : str, optional
+        Error handling behaviour if `text` is a bytestring.
+    encoding : str, optional
+        Encoding of `text` if it is a bytestring.
+    Returns
+    -------
+    str
+        Unicode version of `text`.
+    """
+    if isinstance(text, unicode):
+        return text
+    return unicode(text, encoding, errors=errors)
+
+
+def deaccent(text):
+    """Remove letter accents from the given string.
+    Parameters
+    ----------
+    text : str
+        Input string.
+    Returns
+    -------
+    str
+        Unicode string without accents.
+    """
+    if not isinstance(text, unicode):
+        # assume utf8 for byte strings, use default (strict) error handling
+        text = text.decode('utf8')
+    norm = unicodedata.normalize("NFD", text)
+    result = u('').join(ch for ch in norm if unicodedata.category(ch) != 'Mn')
+    return unicodedata.normalize("NFC", result)
+
+
+def simple_tokenize(text):
+    """Tokenize input test using :const:`PAT_ALPHABETIC`.
+    Parameters
+    ----------
+    text : str
+        Input text.
+    Yields
+    ------
+    str
+        Tokens from `text`.
+    """
+    for match in PAT_ALPHABETIC.finditer(text):
+        yield match.group()
+
+
 def tokenize(text, lowercase=False, deacc=False, encoding='utf8', errors="strict", to_lower=False, lower=False):
     """Iteratively yield tokens as unicode strings, optionally removing accent marks and lowercasing it.
     Parameters
@@ -174,5 +222,6 @@ def effective_n_jobs(n_jobs):
     elif n_jobs is None:
         return 1
     elif n_jobs < 0:
+        from multiprocessing import cpu_count
         n_jobs = max(cpu_count() + 1 + n_jobs, 1)
     return n_jobs
\ No newline at end of file
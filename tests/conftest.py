@@ -0,0 +1,20 @@
+import io
+import os
+
+import pytest
+
+ARTICLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'jr_abst', 'summarization', 'News Articles', 'tech', 'input.txt')
+
+
+@pytest.fixture(scope='session')
+def article():
+    with io.open(ARTICLE, encoding='utf8') as text_file:
+        return text_file.read()
+
+
+@pytest.fixture(scope='session')
+def corpus(article):
+    from jr_abst.summarization.summarizer import _build_corpus
+    from jr_abst.summarization.textcleaner import clean_text_by_sentences
+    return _build_corpus(clean_text_by_sentences(article))
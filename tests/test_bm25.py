@@ -0,0 +1,144 @@
+import os
+import subprocess
+import sys
+
+import numpy
+import pytest
+
+from jr_abst.summarization.bm25 import (BM25, PARALLEL_MIN_DOCUMENTS, BackgroundIDF, IncrementalBM25, InvertedBM25,
+                                        MappedBM25, SparseBM25, close_scoring_pool, iter_bm25_bow)
+from jr_abst.summarization.hashing import hash_token, hash_tokens, hashed_bow_matrix
+from jr_abst.summarization.summarizer import _matrix_bow
+
+CORPUS = [['cat', 'sat', 'mat'], ['dog', 'sat', 'log'], ['cat', 'dog', 'fight'], ['mat', 'log', 'mat']]
+OTHER = [['sun', 'rose'], ['moon', 'rose', 'sun'], ['sun', 'set']]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_sparse_scores_match_dict_scores(corpus):
+    expected = numpy.array([BM25(corpus).get_scores(document) for document in corpus])
+    sparse = SparseBM25(corpus)
+    assert numpy.allclose(sparse.get_scores_matrix(dense=True), expected)
+    assert numpy.allclose([sparse.get_score(corpus[3], i) for i in range(len(corpus))], expected[3])
+
+
+def test_parallel_weights_match_serial_weights(corpus):
+    large = corpus * (PARALLEL_MIN_DOCUMENTS // len(corpus) + 1)
+    try:
+        parallel = list(iter_bm25_bow(large, n_jobs=2))
+    finally:
+        close_scoring_pool()
+    assert parallel == list(iter_bm25_bow(large, sparse=True))
+
+
+def test_parallel_scoring_runs_from_an_unguarded_script(tmp_path):
+    # a script without a __main__ guard, the workers must not run it again
+    script = tmp_path / 'script.py'
+    script.write_text(u'from jr_abst.summarization.bm25 import get_bm25_weights, iter_bm25_bow\n'
+                      u'corpus = [[str(i // 50), str(i // 7)] for i in range(%d)]\n'
+                      u'print(len(list(iter_bm25_bow(corpus, n_jobs=2))), len(get_bm25_weights(corpus, n_jobs=2)))\n'
+                      % PARALLEL_MIN_DOCUMENTS)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.check_output([sys.executable, str(script)], env=env, timeout=120)
+    assert output.split() == [str(PARALLEL_MIN_DOCUMENTS).encode()] * 2
+
+
+def test_incremental_scores_match_rebuilt_model(corpus):
+    model = IncrementalBM25(corpus[:10])
+    model.add_documents(corpus[10:])
+    for index in (0, 5, 5, len(corpus) - 4):
+        model.remove_document(index)
+    documents = corpus[:10] + corpus[10:]
+    for index in (0, 5, 5, len(corpus) - 4):
+        del documents[index]
+    expected = BM25(documents)
+    for document in corpus[:5]:
+        assert numpy.allclose(model.get_scores(document), expected.get_scores(document))
+
+
+def test_max_score_top_n_matches_brute_force(corpus):
+    model = InvertedBM25(corpus)
+    for query in corpus[::3]:
+        for n in (1, 5, len(corpus) + 1):
+            scores = model.get_scores(query)
+            expected = sorted(((i, score) for i, score in enumerate(scores) if score > 0),
+                              key=lambda pair: (-pair[1], pair[0]))[:n]
+            top = model.get_top_n(query, n)
+            assert [i for i, _ in top] == [i for i, _ in expected]
+            assert numpy.allclose([score for _, score in top], [score for _, score in expected])
+
+
+def _hashed_documents():
+    words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta']
+    rnd = numpy.random.RandomState(0)
+    return [[words[i] for i in rnd.randint(len(words), size=rnd.randint(1, 12))] for _ in range(40)]
+
+
+def test_background_idf_replaces_corpus_idf():
+    documents = _hashed_documents()
+    background = BackgroundIDF.from_documents(documents, bits=20)
+    corpus = [list(hash_tokens(document, 20)) for document in documents[:8]]
+    model = BM25(corpus, background, 1.0)
+    for word in model.idf:
+        assert model.idf[word] == pytest.approx(float(background.lookup([word])[0]))
+    # the table of all documents, given half the weight, moves the idf half way
+    mixed = BM25(corpus, background, 0.5)
+    local = BM25(corpus)
+    for word in local.idf:
+        assert mixed.idf[word] == pytest.approx(0.5 * model.idf[word] + 0.5 * local.idf[word])
+
+
+def test_hash_tokens_match_hash_token():
+    tokens = [u'', u'a', u'word', u'wörd', u'日本語', u'word'] + [u'x' * n for n in range(1, 40)]
+    for bits in (1, 8, 20, 32):
+        assert hash_tokens(tokens, bits).tolist() == [hash_token(token, bits) for token in tokens]
+
+
+def test_save_keeps_mapped_models_readable(tmp_path):
+    path = str(tmp_path / 'model')
+    BM25(CORPUS).save(path)
+    mapped = MappedBM25.load(path)
+    before = mapped.get_scores_matrix(dense=True).copy()
+    # the files are replaced, not truncated, under the mapped model
+    BM25(OTHER).save(path)
+    assert numpy.array_equal(mapped.get_scores_matrix(dense=True), before)
+    reloaded = MappedBM25.load(path)
+    assert numpy.allclose(reloaded.get_scores_matrix(dense=True), SparseBM25(OTHER).get_scores_matrix(dense=True))
+    assert not [name for name in os.listdir(path) if name.endswith('.tmp')]
+
+
+def test_mapped_weights_are_built_once(tmp_path):
+    path = str(tmp_path / 'model')
+    BM25(CORPUS).save(path)
+    mapped = MappedBM25.load(path)
+    assert mapped.weights is mapped.weights
+    assert mapped.weights.shape == (len(CORPUS), len(mapped.vocabulary))
+    assert numpy.allclose(mapped.weights.sum(axis=1), SparseBM25(CORPUS).weights.sum(axis=1))
+
+
+def test_background_idf_save_keeps_mapped_tables(tmp_path):
+    path = str(tmp_path / 'idf')
+    BackgroundIDF.from_documents(CORPUS, bits=8).save(path)
+    mapped = BackgroundIDF.load(path + '.npy')
+    before = numpy.array(mapped.idf)
+    BackgroundIDF.from_documents(OTHER, bits=8).save(path + '.npy')
+    assert numpy.array_equal(mapped.idf, before)
+    assert not numpy.array_equal(BackgroundIDF.load(path + '.npy').idf, before)
+
+
+def test_bow_matrix_model_matches_doc2bow_model():
+    documents = _hashed_documents()
+    for bits in (20, 32):
+        matrix = hashed_bow_matrix(documents, bits)
+        # 32 bit ids above 2 ** 31 are kept apart from the counts of their pairs
+        assert bits < 32 or matrix.indices.max() >= 2 ** 31
+        model = SparseBM25.from_bow_matrix(matrix)
+        expected = SparseBM25(_matrix_bow(matrix))
+        assert model.idf == pytest.approx(expected.idf)
+        assert numpy.allclose(model.get_scores_matrix(dense=True), expected.get_scores_matrix(dense=True))
+
+    matrix = hashed_bow_matrix(documents, 20)
+    background = BackgroundIDF.from_documents(documents[:10], bits=20)
+    model = SparseBM25.from_bow_matrix(matrix, background, 0.5)
+    expected = SparseBM25(_matrix_bow(matrix), background, 0.5)
+    assert model.idf == pytest.approx(expected.idf)
@@ -0,0 +1,61 @@
+from jr_abst.summarization.cache import SummaryCache, make_key
+from jr_abst.summarization.summarizer import summarize
+
+
+def test_key_depends_on_parameters():
+    assert make_key(u"Some text.") == make_key(u"Some text.", 0.2, None, False, top_k=None, approximate=False)
+    assert make_key(u"Some text.") != make_key(u"Some text.", ratio=0.3)
+    assert make_key(u"Some text.") != make_key(u"Some text.", word_count=10)
+    assert make_key(u"Some text.") != make_key(u"Some text.", split=True)
+    assert make_key(u"Some text.") != make_key(u"Some text.", top_k=5)
+
+
+def test_key_keeps_line_breaks(article):
+    # the same words on separate lines split into many more sentences than on one line
+    lines = article.replace(u'. ', u'\n')
+    one_line = article.replace(u'. ', u' ')
+    assert make_key(lines) != make_key(one_line)
+
+    cache = SummaryCache()
+    assert summarize(lines, cache=cache) == summarize(lines)
+    assert summarize(one_line, cache=cache) == summarize(one_line)
+    assert cache.info().hits == 0
+
+
+def test_key_keeps_spaces():
+    # a second space after an abbreviation makes it end a sentence
+    assert make_key(u"Mr. Smith went home.") != make_key(u"Mr.  Smith went home.")
+
+
+def test_hits_return_copies(article):
+    cache = SummaryCache()
+    summary = summarize(article, split=True, cache=cache)
+    cached = summarize(article, split=True, cache=cache)
+    assert cached == summary
+    assert cache.info().hits == 1
+    cached.append(u"changed")
+    assert summarize(article, split=True, cache=cache) == summary
+
+
+def test_lru_eviction():
+    cache = SummaryCache(maxsize=2)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, key * 3)
+    assert 'a' not in cache
+    assert cache.get('b') == 'bbb'
+    cache.put('d', 'ddd')
+    assert 'c' not in cache and 'b' in cache
+
+
+def test_maxbytes_eviction():
+    cache = SummaryCache(maxbytes=10)
+    cache.put('a', u'x' * 6)
+    cache.put('b', u'y' * 6)
+    assert len(cache) == 1 and cache.get('b') == u'y' * 6
+
+
+def test_disk_tier_survives_restarts(tmp_path, article):
+    summary = summarize(article, cache=SummaryCache(directory=str(tmp_path)))
+    cache = SummaryCache(directory=str(tmp_path))
+    assert summarize(article, cache=cache) == summary
+    assert cache.info().disk_hits == 1
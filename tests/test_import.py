@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _loaded(statement):
+    check = statement + '; print([name for name in ("numpy", "scipy", "gensim") if name in sys.modules])'
+    return subprocess.check_output([sys.executable, '-c', 'import sys; ' + check], cwd=ROOT).decode('utf8').strip()
+
+
+def test_package_import_loads_no_heavy_module():
+    assert _loaded('import jr_abst.summarization') == '[]'
+
+
+def test_summarizer_import_loads_no_gensim():
+    assert _loaded('import jr_abst.summarization.summarizer') == "['numpy', 'scipy']"
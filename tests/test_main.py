@@ -0,0 +1,59 @@
+import io
+import json
+import os
+
+from jr_abst.summarization import summarizer
+from jr_abst.summarization.__main__ import main
+from jr_abst.summarization.summarizer import summarize
+
+
+def _records(path):
+    with io.open(path, encoding='utf8') as lines:
+        return [json.loads(line) for line in lines]
+
+
+def test_jsonl_records_are_summarized_in_order_and_resumed(article, tmp_path):
+    texts = [article, article[:len(article) // 2]]
+    inputs = str(tmp_path / 'input.jsonl')
+    output = str(tmp_path / 'output.jsonl')
+    with io.open(inputs, 'w', encoding='utf8') as records:
+        records.write(u''.join(json.dumps({'id': i, 'text': text}) + u'\n' for i, text in enumerate(texts)))
+        records.write(u'not json\n')
+    assert main([inputs, '--output', output, '--stats-interval', '0']) == 0
+    results = _records(output)
+    assert [result['id'] for result in results] == [0, 1, inputs + ':3']
+    assert [result['summary'] for result in results[:2]] == [summarize(text) for text in texts]
+    assert 'error' in results[2]
+
+    # a run cut in the middle of a line is resumed from the last complete record
+    with io.open(output, 'r+', encoding='utf8') as lines:
+        complete = lines.readline()
+        lines.seek(0)
+        lines.truncate()
+        lines.write(complete + u'{"id": 1, "summ')
+    assert main([inputs, '--output', output, '--resume', '--stats-interval', '0']) == 0
+    assert _records(output) == results
+
+
+def test_record_that_kills_its_worker_is_written_as_an_error(article, tmp_path, monkeypatch):
+    summarize_text = summarizer.summarize
+
+    def summarize_or_die(text, **kwargs):
+        if text == u'crash':
+            os._exit(1)
+        return summarize_text(text, **kwargs)
+
+    monkeypatch.setattr(summarizer, 'summarize', summarize_or_die)
+    texts = [article, u'crash', article[:len(article) // 2]]
+    inputs = str(tmp_path / 'input.jsonl')
+    output = str(tmp_path / 'output.jsonl')
+    with io.open(inputs, 'w', encoding='utf8') as records:
+        records.write(u''.join(json.dumps({'id': i, 'text': text}) + u'\n' for i, text in enumerate(texts)))
+    assert main([inputs, '--output', output, '--n-jobs', '2', '--stats-interval', '0']) == 0
+    results = _records(output)
+    assert [sorted(result) for result in results] == [['id', 'summary'], ['error', 'id'], ['id', 'summary']]
+    assert [result['summary'] for result in results[::2]] == [summarize_text(text) for text in texts[::2]]
+
+    # the record is not run again on resume
+    assert main([inputs, '--output', output, '--n-jobs', '2', '--resume', '--stats-interval', '0']) == 0
+    assert _records(output) == results
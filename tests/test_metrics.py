@@ -0,0 +1,46 @@
+import tracemalloc
+
+import numpy
+
+from jr_abst.summarization.metrics import MetricsRecorder, stage
+from jr_abst.summarization.summarizer import summarize
+
+
+def test_stage_memory_is_its_own_peak():
+    recorder = MetricsRecorder()
+    tracemalloc.start()
+    try:
+        with stage(recorder, 'large'):
+            data = numpy.ones(10 ** 6)
+            del data
+        kept = numpy.ones(10 ** 6)
+        with stage(recorder, 'small'):
+            numpy.ones(10 ** 4)
+    finally:
+        tracemalloc.stop()
+    large, small = recorder.records
+    assert large.peak_allocated >= 8 * 10 ** 6
+    # neither the array allocated before the stage nor the peak of the stage before count
+    assert 8 * 10 ** 4 <= small.peak_allocated < 10 ** 6
+    assert kept.size == 10 ** 6
+    assert large.process_max_rss is None or large.process_max_rss >= large.peak_allocated
+
+
+def test_stage_memory_is_none_untraced(article):
+    recorder = MetricsRecorder()
+    summarize(article, metrics=recorder)
+    stages = [record.stage for record in recorder.records]
+    assert stages == ['cleaning', 'corpus', 'bm25', 'graph', 'prune', 'pagerank', 'selection']
+    assert all(record.peak_allocated is None for record in recorder.records)
+    totals = recorder.totals()
+    assert list(totals) == stages
+
+
+def test_default_graph_reports_bm25_apart(article):
+    recorder = MetricsRecorder()
+    summarize(article, metrics=recorder)
+    records = dict((record.stage, record) for record in recorder.records)
+    sentences = records['corpus'].nodes
+    # every sentence scores at least itself
+    assert records['bm25'].nodes == sentences and records['bm25'].edges >= sentences
+    assert records['graph'].nodes == sentences
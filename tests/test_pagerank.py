@@ -0,0 +1,40 @@
+import numpy
+from scipy.sparse import random as sparse_random
+
+from jr_abst.summarization.graph import ArrayGraph
+from jr_abst.summarization.pagerank_weighted import pagerank_weighted_vector
+
+
+def _graph(seed, symmetric):
+    matrix = sparse_random(40, 40, density=0.2, random_state=seed, format='csr')
+    matrix.setdiag(0)
+    if symmetric:
+        matrix = matrix + matrix.T
+    return ArrayGraph(range(40), matrix)
+
+
+def _power_ranks(adjacency, damping=0.85):
+    # the walk follows the rows of the adjacency, normalized to sum to one
+    matrix = adjacency.toarray()
+    sums = matrix.sum(axis=1, keepdims=True)
+    matrix = numpy.divide(matrix, sums, out=numpy.zeros_like(matrix), where=sums != 0)
+    vec = numpy.full(len(matrix), 1.0 / len(matrix))
+    for _ in range(1000):
+        vec = damping * matrix.T.dot(vec) + (1 - damping) / len(matrix) * vec.sum()
+        vec /= vec.sum()
+    return vec / numpy.linalg.norm(vec)
+
+
+def test_sparse_ranks_of_asymmetric_graph_follow_the_rows():
+    for seed in range(5):
+        graph = _graph(seed, symmetric=False)
+        ranks = pagerank_weighted_vector(graph, sparse=True, tol=1e-12, max_iter=1000)
+        assert numpy.allclose(ranks, _power_ranks(graph.adjacency), atol=1e-9)
+
+
+def test_sparse_ranks_match_eigenvector():
+    for seed in range(5):
+        graph = _graph(seed, symmetric=True)
+        sparse = pagerank_weighted_vector(graph, sparse=True, tol=1e-12, max_iter=1000)
+        dense = pagerank_weighted_vector(graph)
+        assert numpy.allclose(sparse, dense / numpy.linalg.norm(dense), atol=1e-6)
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from jr_abst.summarization import service
+from jr_abst.summarization.service import SummarizationService
+from jr_abst.summarization.summarizer import summarize
+
+SUMMARIZE = service._summarize
+
+
+def _crashing_summarize(text, **options):
+    # the worker dies as if it ran out of memory
+    if text == u'crash':
+        os._exit(1)
+    return SUMMARIZE(text, **options)
+
+
+def _slow_summarize(text, **options):
+    time.sleep(0.2)
+    return SUMMARIZE(text, **options)
+
+
+def test_dead_worker_restarts_the_pool(article, monkeypatch):
+    monkeypatch.setattr(service, '_summarize', _crashing_summarize)
+
+    async def run():
+        async with SummarizationService(1) as summarizer:
+            with pytest.raises(BrokenProcessPool):
+                await summarizer.summarize(u'crash')
+            summary = await summarizer.summarize(article)
+            return summary, summarizer.stats()
+
+    summary, stats = asyncio.run(run())
+    assert summary == summarize(article)
+    assert stats['restarts'] == 1
+
+
+def test_zero_timeout_is_not_the_default(article, monkeypatch):
+    monkeypatch.setattr(service, '_summarize', _slow_summarize)
+
+    async def run():
+        async with SummarizationService(1, 'thread', timeout=10) as summarizer:
+            with pytest.raises(asyncio.TimeoutError):
+                await summarizer.summarize(article, timeout=0)
+            # the default of the service applies to the requests without one
+            return await summarizer.summarize(article), summarizer.stats()
+
+    summary, stats = asyncio.run(run())
+    assert summary == summarize(article)
+    assert stats['timeouts'] == 1 and stats['coalesced'] == 1
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from jr_abst.summarization import streaming, textcleaner
+from jr_abst.summarization.streaming import summarize_stream
+from jr_abst.summarization.summarizer import WEIGHT_THRESHOLD, summarize
+from jr_abst.summarization.textcleaner import SentenceBuffer, iter_stream_sentences, split_sentences
+
+PIECES = [u'Mr. ', u'Smith', u' ', u'.', u'\n', u'went', u'!', u'? ', u'a.b. ', u'e.g. x', u'  ', u'3.5', u'Dr.',
+          u'\n\n', u'x', u'. ', u'End', u'\t']
+
+
+def _chunks(text, rnd):
+    cuts = sorted(rnd.sample(range(len(text) + 1), min(len(text) + 1, rnd.randint(0, 10))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_stream_sentences_match_split_sentences(article):
+    rnd = random.Random(0)
+    for _ in range(2000):
+        text = u''.join(rnd.choice(PIECES) for _ in range(rnd.randint(0, 40)))
+        assert list(iter_stream_sentences(_chunks(text, rnd))) == split_sentences(text)
+    chunks = [article[start:start + 100] for start in range(0, len(article), 100)]
+    assert list(iter_stream_sentences(chunks)) == split_sentences(article)
+
+
+def test_sentences_come_out_once_complete():
+    buffer = SentenceBuffer()
+    assert buffer.feed(u"First sentence") == []
+    assert buffer.feed(u". Second") == [u"First sentence."]
+    assert buffer.feed(u" one") == []
+    assert buffer.feed(u"\nThird") == [u"Second one"]
+    assert buffer.close() == [u"Third"]
+
+
+def test_chunks_without_sentence_end_are_not_split_again(monkeypatch):
+    calls = []
+    spans = textcleaner.iter_sentence_spans
+
+    def counting_spans(text):
+        calls.append(len(text))
+        return spans(text)
+
+    monkeypatch.setattr(textcleaner, 'iter_sentence_spans', counting_spans)
+    buffer = SentenceBuffer()
+    for _ in range(1000):
+        assert buffer.feed(u"word word ") == []
+    assert calls == []
+    assert buffer.close() == [u"word word " * 1000]
+
+
+def test_stream_of_one_window_matches_summarize(article):
+    chunks = [article[start:start + 500] for start in range(0, len(article), 500)]
+    assert summarize_stream(chunks) == summarize(article, sparse=True)
+    assert summarize_stream(iter([article]), split=True) == summarize(article, sparse=True, split=True)
+
+
+@pytest.fixture(scope='module')
+def long_text():
+    rnd = random.Random(1)
+    words = [u'word%d' % i for i in range(300)]
+    return u' '.join(u' '.join(rnd.choice(words) for _ in range(8)) + u'.' for _ in range(1500))
+
+
+def test_candidates_stay_bounded(long_text, monkeypatch):
+    sizes = []
+    trim = streaming._trim_candidates
+
+    def recording_trim(kept, limit):
+        sizes.append(len(kept))
+        trim(kept, limit)
+
+    monkeypatch.setattr(streaming, '_trim_candidates', recording_trim)
+    summary = summarize_stream([long_text], word_count=100, window=50, split=True)
+    assert summary and sum(len(sentence.split()) for sentence in summary) <= 110
+    assert sizes and max(sizes) < 2 * 50 + 50
+
+    sizes[:] = []
+    summary = summarize_stream([long_text], ratio=0.05, window=50, split=True)
+    assert len(summary) == int(1500 * 0.05)
+    assert max(sizes) < 2 * 75 + 50
+
+
+def test_live_edges_match_pairwise_scores(long_text):
+    live = streaming.LiveSummarizer()
+    live.add_text(long_text[:len(long_text) // 2])
+    live.add_text(long_text[len(long_text) // 2:])
+    live.flush()
+    # the graph of the last statistics, every pair scored with get_score as the live edges were before
+    live.rebuild()
+    bm25 = live.bm25
+    expected = {}
+    for j in range(len(live.corpus)):
+        for i in range(j):
+            if not set(live.corpus[i]) & set(live.corpus[j]):
+                continue
+            weight = bm25.get_score(live.corpus[i], j)
+            if weight < WEIGHT_THRESHOLD:
+                weight = bm25.get_score(live.corpus[j], i)
+            if weight >= WEIGHT_THRESHOLD:
+                expected[i, j] = weight
+    edges = dict(((i, j), weight) for i, j, weight in zip(live._first, live._second, live._weights))
+    assert sorted(edges) == sorted(expected)
+    assert all(abs(edges[pair] - expected[pair]) < 1e-9 for pair in expected)
@@ -0,0 +1,80 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from jr_abst.summarization import summarizer
+from jr_abst.summarization.summarizer import summarize, summarize_many
+
+
+@pytest.fixture(scope='module')
+def texts(article):
+    sentences = [sentence + u'.' for sentence in article.split(u'. ') if sentence]
+    # texts of different lengths, one too short to summarize
+    return [u' '.join(sentences[start:start + size]) for start, size in ((0, 12), (5, 20), (0, 1), (10, 15))]
+
+
+def _same(results, expected):
+    assert len(results) == len(expected)
+    for result, summary in zip(results, expected):
+        if isinstance(summary, Exception):
+            assert type(result) is type(summary)
+        else:
+            assert result == summary
+
+
+def _expected(texts, **kwargs):
+    expected = []
+    for text in texts:
+        try:
+            expected.append(summarize(text, **kwargs))
+        except Exception as error:
+            expected.append(error)
+    return expected
+
+
+def test_serial_matches_summarize(texts):
+    results = list(summarize_many(texts, chunksize=2))
+    _same(results, _expected(texts))
+    assert isinstance(results[2], ValueError)
+
+
+def test_processes_match_summarize(texts):
+    _same(list(summarize_many(texts * 3, n_jobs=2, chunksize=2)), _expected(texts * 3))
+
+
+def test_batch_matches_sparse_summarize(texts):
+    _same(list(summarize_many(texts, chunksize=4, batch=True)), _expected(texts, sparse=True))
+
+
+def test_batch_keeps_ranking_errors_with_their_text(texts, monkeypatch):
+    build = summarizer._build_ranking_graph
+    failing = summarizer._build_summary_corpus(texts[1])[1]
+
+    def build_or_fail(corpus, *args, **kwargs):
+        if corpus == failing:
+            raise MemoryError("graph too large")
+        return build(corpus, *args, **kwargs)
+
+    monkeypatch.setattr(summarizer, '_build_ranking_graph', build_or_fail)
+    results = list(summarize_many(texts, chunksize=4, batch=True))
+    expected = _expected(texts, sparse=True)
+    assert isinstance(results[1], MemoryError)
+    _same(results[:1] + results[2:], expected[:1] + expected[2:])
+
+
+def test_worker_killed_by_a_text_fails_only_that_text(texts, monkeypatch):
+    summarize_text = summarizer.summarize
+
+    def summarize_or_die(text, **kwargs):
+        if text == u'crash':
+            # a worker killed by the system or a crash in native code
+            os._exit(1)
+        return summarize_text(text, **kwargs)
+
+    monkeypatch.setattr(summarizer, 'summarize', summarize_or_die)
+    inputs = texts[:2] + [u'crash'] + texts[2:] + [u'crash'] + texts
+    results = list(summarize_many(inputs, n_jobs=2, max_pending=3))
+    assert [isinstance(result, BrokenProcessPool) for result in results] == [text == u'crash' for text in inputs]
+    expected = _expected(texts)
+    _same([result for result, text in zip(results, inputs) if text != u'crash'], expected + expected)
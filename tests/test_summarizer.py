@@ -0,0 +1,77 @@
+import numpy
+
+from jr_abst.summarization.summarizer import (_build_array_graph, _build_summary_corpus, _extract_important_sentences,
+                                              rank_sentences, rank_sentences_batch, summarize, summarize_corpus)
+from jr_abst.summarization.syntactic_unit import SyntacticUnitStore
+
+
+def test_array_graph_summarizes_as_dict_graph(article, corpus):
+    assert summarize_corpus(corpus, sparse=True) == summarize_corpus(corpus)
+    assert summarize(article, sparse=True) == summarize(article)
+
+
+def _scores(ranking, length):
+    indices, scores = ranking
+    by_index = numpy.zeros(length)
+    by_index[indices] = scores
+    return by_index
+
+
+def test_array_graph_ranks_as_dict_graph(corpus):
+    dense = _scores(rank_sentences(corpus), len(corpus))
+    sparse = _scores(rank_sentences(corpus, sparse=True), len(corpus))
+    assert numpy.allclose(dense / numpy.linalg.norm(dense), sparse, atol=1e-6)
+
+
+def test_unreachable_sentences_score_zero():
+    corpus = [[(0, 1), (1, 1)], [(0, 1), (1, 1), (2, 1)], [(1, 1), (2, 1)], [(7, 1)], [(0, 1), (2, 1)]]
+    for sparse in (False, True):
+        indices, scores = rank_sentences(corpus, sparse=sparse)
+        assert indices[-1] == 3 and scores[-1] == 0
+        assert (scores[:-1] > 0).all()
+
+
+def test_top_k_of_every_neighbour_is_the_exact_graph(corpus):
+    exact = _build_array_graph(corpus).adjacency
+    assert (abs(_build_array_graph(corpus, top_k=len(corpus)).adjacency - exact)).max() < 1e-12
+    # the approximate graph only drops edges, the ones it keeps have their exact weight
+    approximate = _build_array_graph(corpus, top_k=len(corpus), approximate=True).adjacency.tocoo()
+    assert numpy.allclose(exact[approximate.row, approximate.col].A1, approximate.data)
+
+
+def test_sentences_without_shared_words_rank_in_order():
+    corpus = [[(i, 1)] for i in range(5)]
+    for sparse in (False, True):
+        indices, scores = rank_sentences(corpus, sparse=sparse)
+        assert indices.tolist() == list(range(5))
+        assert numpy.allclose(scores, scores[0])
+
+
+def test_batch_ranks_as_every_corpus_alone(corpus):
+    corpora = [corpus, corpus[:10], corpus[:2], corpus[20:45], []]
+    for ranking, alone in zip(rank_sentences_batch(corpora), corpora):
+        expected = rank_sentences(alone, sparse=True)
+        assert ranking[0].tolist() == expected[0].tolist()
+        assert numpy.allclose(ranking[1], expected[1], atol=1e-6)
+
+
+def test_hashed_ids_summarize_as_dictionary_ids(article):
+    assert summarize(article, hash_bits=20) == summarize(article)
+    assert summarize(article, hash_bits=32, sparse=True) == summarize(article, sparse=True)
+
+
+def test_word_count_builds_only_the_selected_units(article, monkeypatch):
+    sentences, corpus = _build_summary_corpus(article)
+    indices, scores = rank_sentences(corpus)
+    units = [unit.text for unit in _extract_important_sentences(sentences.units(), indices, scores, 60)]
+    built = []
+    get_unit = SyntacticUnitStore.__getitem__
+
+    def get_counted_unit(store, i):
+        built.append(i)
+        return get_unit(store, i)
+
+    monkeypatch.setattr(SyntacticUnitStore, '__getitem__', get_counted_unit)
+    selected = _extract_important_sentences(sentences, indices, scores, 60)
+    assert [unit.text for unit in selected] == units
+    assert built == indices[:len(units)].tolist()
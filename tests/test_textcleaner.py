@@ -0,0 +1,41 @@
+import random
+
+from gensim.parsing.preprocessing import preprocess_string
+
+from jr_abst.summarization.textcleaner import (TextPreprocessor, build_sentence_store, get_sentences,
+                                               merge_syntactic_units, replace_abbreviations, split_sentences,
+                                               undo_replacement)
+
+PIECES = [u'Mr. ', u'Mr.\n', u'Smith', u' ', u'.', u'\n', u'went', u'!', u'? ', u'a.b. ', u'e.g. x', u'  ',
+          u'3.5', u'Dr.', u'\n\n', u'x', u'. ', u'End', u'\t', u'U.S.\tArmy']
+
+
+def _regex_sentences(text):
+    # the splitter before sentence spans: abbreviations replaced, RE_SENTENCE, replacement undone
+    return [undo_replacement(sentence) for sentence in get_sentences(replace_abbreviations(text))]
+
+
+def test_sentence_spans_match_regex_splitter(article):
+    assert split_sentences(article) == _regex_sentences(article)
+    rnd = random.Random(0)
+    for _ in range(3000):
+        text = u''.join(rnd.choice(PIECES) for _ in range(rnd.randint(0, 30)))
+        # the spans keep the whitespace after an abbreviation as it is, the regex splitter made it a space
+        sentences = [undo_replacement(replace_abbreviations(sentence)) for sentence in split_sentences(text)]
+        assert sentences == _regex_sentences(text)
+
+
+def test_preprocessor_matches_gensim(article):
+    preprocessor = TextPreprocessor()
+    for sentence in split_sentences(article) + [u'<b>Tagged</b> text, with 3 digits and-punctuation!']:
+        assert preprocessor.preprocess(sentence) == preprocess_string(sentence)
+
+
+def test_sentence_store_matches_syntactic_units(article):
+    sentences = split_sentences(article)
+    tokens = [u' '.join(preprocess_string(sentence)) for sentence in sentences]
+    expected = merge_syntactic_units(sentences, tokens)
+    store = build_sentence_store(article)
+    assert len(store) == len(expected)
+    for unit, other in zip(store, expected):
+        assert (unit.text, unit.token, unit.index) == (other.text, other.token, other.index)